@@ -1,10 +1,8 @@
-from store import FAISSVectorStore
 from rag import CertRAG
 import dotenv
 
 dotenv.load_dotenv()
 
-faiss_vector_store = FAISSVectorStore()
 requirement = """Goal: Notify the surrounding people, cyclists and other road users of the Vehicle's reverse movement by external sound.
 Description:
 AVAS sound starts when moving in R starts (vehicle speed > 0).
@@ -22,10 +20,10 @@ Driver stops pressing acceleration pedal and the vehicle's speed is equal 0
 Driver stops moving in reverse
 """
 
-# identified_objects = faiss_vector_store.search_similar(requirement)
+cert_rag = CertRAG(rag_type="default")
+
+# identified_objects = cert_rag.faiss_vector_store.search_similar(requirement)
 # for obj, score in identified_objects:
 #     print(f"Score: {score}\n Object: {obj}\n =========================\n")
 
-cert_rag = CertRAG(rag_type="default")
-
 print(cert_rag.cert_documents(requirement))
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+from lexical import fingerprint
+from registry import get_embeddings
+from store import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    INDEX_TYPES,
+    FAISSVectorStore,
+    build_manifest,
+    document_hash,
+    next_version,
+    save_faiss_index,
+    split_document,
+)
+from utils import load_document
+
+CHECKPOINT_FILE = "build.json"
+
+
+def load_and_split(file_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Загружает и разбивает на сегменты один файл. Выполняется в отдельном процессе.
+
+    :return: Имя файла, хэш его содержимого и тексты сегментов. None для неподдерживаемых файлов.
+    """
+    document = load_document(file_path)
+    if document is None:
+        return None
+    return (
+        document["metadata"]["source"],
+        document_hash(document),
+        split_document(document, chunk_size, chunk_overlap),
+    )
+
+
+def load_chunks(
+    documents_path, workers=None, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+):
+    """
+    Параллельно загружает и разбивает все документы каталога.
+
+    Файлы обрабатываются в порядке имен, поэтому номера сегментов (chunk_id)
+    одинаковы при каждом запуске и контрольные точки остаются валидными.
+
+    :param documents_path: Каталог с .txt, .pdf и .docx файлами.
+    :param workers: Число процессов, по умолчанию по числу ядер.
+    :return: Тексты сегментов, их метаданные и хэши файлов.
+    """
+    file_paths = [
+        os.path.join(documents_path, filename)
+        for filename in sorted(os.listdir(documents_path))
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        splits = executor.map(
+            load_and_split,
+            file_paths,
+            [chunk_size] * len(file_paths),
+            [chunk_overlap] * len(file_paths),
+        )
+        splits = [split for split in splits if split is not None]
+
+    texts = []
+    metadatas = []
+    hashes = {}
+    for source, file_hash, file_texts in splits:
+        hashes[source] = file_hash
+        for text in file_texts:
+            texts.append(text)
+            metadatas.append({"source": source, "chunk_id": len(texts)})
+    return texts, metadatas, hashes
+
+
+class BuildCheckpoint:
+    def __init__(self, path, build_id, num_blocks):
+        """
+        Контрольные точки сборки индекса: по файлу с эмбеддингами на каждый блок сегментов.
+
+        Если каталог остался от сборки с другими сегментами, моделью или размером
+        блока, он очищается.
+
+        :param path: Каталог контрольных точек.
+        :param build_id: Отпечаток сегментов и настроек сборки.
+        :param num_blocks: Число блоков.
+        """
+        self.path = path
+        meta_path = os.path.join(path, CHECKPOINT_FILE)
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        if meta is None or meta.get("build_id") != build_id:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+            with open(meta_path, "w", encoding="utf-8") as file:
+                json.dump({"build_id": build_id, "num_blocks": num_blocks}, file)
+
+    def block_path(self, block):
+        return os.path.join(self.path, f"block_{block:06d}.npy")
+
+    def has(self, block):
+        return os.path.exists(self.block_path(block))
+
+    def load(self, block):
+        return np.load(self.block_path(block))
+
+    def save(self, block, vectors):
+        # Блок пишется во временный файл и переименовывается, чтобы прерванная
+        # запись не оставила полуготовую контрольную точку
+        tmp_path = f"{self.block_path(block)}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_path, self.block_path(block))
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def embed_chunks(embeddings, texts, checkpoint, checkpoint_every, batch_size, threads):
+    """
+    Эмбеддит сегменты пачками в нескольких потоках, сохраняя каждый блок из
+    checkpoint_every сегментов. Уже сохраненные блоки не пересчитываются.
+
+    :return: Матрица float32 эмбеддингов в порядке сегментов.
+    """
+    num_blocks = (len(texts) + checkpoint_every - 1) // checkpoint_every
+    done = sum(checkpoint.has(block) for block in range(num_blocks))
+    if done:
+        print(f"Resuming: {done} of {num_blocks} blocks already embedded")
+
+    blocks = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for block in tqdm(range(num_blocks), desc="Embedding", unit="block"):
+            if checkpoint.has(block):
+                blocks.append(checkpoint.load(block))
+                continue
+            block_texts = texts[
+                block * checkpoint_every : (block + 1) * checkpoint_every
+            ]
+            batches = [
+                block_texts[start : start + batch_size]
+                for start in range(0, len(block_texts), batch_size)
+            ]
+            vectors = np.concatenate(
+                [
+                    np.asarray(batch_vectors, dtype=np.float32)
+                    for batch_vectors in executor.map(
+                        embeddings.embed_documents, batches
+                    )
+                ]
+            )
+            checkpoint.save(block, vectors)
+            blocks.append(vectors)
+    return np.concatenate(blocks)
+
+
+def build_index(
+    documents_path="RegDocs",
+    index_path="db/faiss_index",
+    model_name_or_path="sentence-transformers/all-MiniLM-L6-v2",
+    embedding_cache_path="db/embedding_cache.sqlite",
+    index_type="flat",
+    index_params=None,
+    workers=None,
+    threads=4,
+    batch_size=64,
+    checkpoint_every=1024,
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+):
+    """
+    Строит FAISS индекс по каталогу документов в несколько этапов.
+
+    1. Параллельная загрузка и разбиение файлов в workers процессах.
+    2. Эмбеддинг пачками по batch_size сегментов в threads потоках.
+    3. Сохранение эмбеддингов каждые checkpoint_every сегментов в каталог
+       {index_path}.checkpoint, откуда прерванная сборка продолжается.
+    4. Сборка индекса во временном каталоге и атомарная подмена index_path.
+
+    :return: Итоговые параметры индекса.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index_type must be one of {INDEX_TYPES}")
+    if batch_size < 1 or threads < 1 or checkpoint_every < 1:
+        raise ValueError("batch_size, threads and checkpoint_every must be positive")
+
+    texts, metadatas, hashes = load_chunks(
+        documents_path, workers, chunk_size, chunk_overlap
+    )
+    if not texts:
+        raise FileNotFoundError(f"No documents to index in {documents_path}")
+    print(f"Loaded {len(texts)} chunks from {documents_path}")
+
+    embeddings = get_embeddings(model_name_or_path, embedding_cache_path)
+    num_blocks = (len(texts) + checkpoint_every - 1) // checkpoint_every
+    build_id = fingerprint(
+        [model_name_or_path, str(checkpoint_every)]
+        + [f"{metadata['source']}\0{text}" for text, metadata in zip(texts, metadatas)]
+    )
+    checkpoint = BuildCheckpoint(
+        f"{index_path.rstrip(os.sep)}.checkpoint", build_id, num_blocks
+    )
+    vectors = embed_chunks(
+        embeddings, texts, checkpoint, checkpoint_every, batch_size, threads
+    )
+
+    params = save_faiss_index(
+        index_path,
+        texts,
+        metadatas,
+        vectors,
+        embeddings,
+        index_type,
+        index_params,
+        build_manifest(hashes, metadatas, next_version(index_path)),
+    )
+    checkpoint.remove()
+    print(f"FAISS index ({index_type}, {params}) published to {index_path}")
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the FAISS index of regulation documents."
+    )
+    parser.add_argument(
+        "--documents", default="RegDocs", help="Directory with regulation documents"
+    )
+    parser.add_argument(
+        "--index", default="db/faiss_index", help="Directory of the FAISS index"
+    )
+    parser.add_argument(
+        "--model",
+        default="sentence-transformers/all-MiniLM-L6-v2",
+        help="Sentence-transformers embedding model",
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        default="db/embedding_cache.sqlite",
+        help="Embedding cache file, empty string disables the cache",
+    )
+    parser.add_argument(
+        "--index-type", default="flat", choices=INDEX_TYPES, help="FAISS index type"
+    )
+    parser.add_argument(
+        "--index-params",
+        default="{}",
+        help='Index parameters as JSON, e.g. \'{"nlist": 256, "m": 16}\'',
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Processes for loading and splitting documents"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=4, help="Threads for embedding batches"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="Chunks per embedding call"
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=1024,
+        help="Save embeddings every N chunks so an interrupted build can resume",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Re-index only added, changed and removed files of an existing index",
+    )
+    args = parser.parse_args()
+
+    if args.update and os.path.exists(args.index):
+        store = FAISSVectorStore(
+            model_name_or_path=args.model,
+            index_path=args.index,
+            documents_path=args.documents,
+            embedding_cache_path=args.embedding_cache or None,
+            index_type=args.index_type,
+            index_params=json.loads(args.index_params),
+        )
+        print(json.dumps(store.update(), ensure_ascii=False, indent=2))
+        return
+
+    build_index(
+        documents_path=args.documents,
+        index_path=args.index,
+        model_name_or_path=args.model,
+        embedding_cache_path=args.embedding_cache or None,
+        index_type=args.index_type,
+        index_params=json.loads(args.index_params),
+        workers=args.workers,
+        threads=args.threads,
+        batch_size=args.batch_size,
+        checkpoint_every=args.checkpoint_every,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "import_baseline.json"
+)
+# Модули, которые не должны загружаться при импорте rag: их используют только RAPTOR и реранкер
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "umap", "sklearn"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def measure_import(module, runs):
+    """
+    Measures cold import time of a module, each run in a fresh interpreter.
+
+    Returns the best time over all runs and the heavy modules loaded by the import.
+    """
+    best = None
+    heavy = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best = result["seconds"] if best is None else min(best, result["seconds"])
+        heavy.update(result["heavy"])
+    return best, sorted(heavy)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that cold import of the application modules stays fast."
+    )
+    parser.add_argument(
+        "--module",
+        action="append",
+        help="Module to import (can be repeated, default: rag)",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Fresh interpreters per module"
+    )
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_FILE,
+        help="JSON file with baseline import times in seconds (default: next to this script)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown relative to the baseline (0.2 = 20%%)",
+    )
+    parser.add_argument(
+        "--slack",
+        type=float,
+        default=0.05,
+        help="Allowed slowdown in seconds on top of the relative tolerance",
+    )
+    parser.add_argument(
+        "--max-seconds", type=float, help="Absolute limit on the import time"
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Write the measured times to the baseline file",
+    )
+    args = parser.parse_args()
+
+    modules = args.module or ["rag"]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    failed = False
+    measured = {}
+    for module in modules:
+        seconds, heavy = measure_import(module, args.runs)
+        measured[module] = seconds
+        print(f"import {module}: {seconds:.3f}s (best of {args.runs})")
+
+        if heavy:
+            print(f"  FAIL: heavy modules loaded on import: {', '.join(heavy)}")
+            failed = True
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            print(f"  FAIL: slower than the limit of {args.max_seconds:.3f}s")
+            failed = True
+        if (
+            not args.update_baseline
+            and module not in baseline
+            and args.max_seconds is None
+        ):
+            print(
+                f"  FAIL: no baseline for {module} in {args.baseline} and no --max-seconds; "
+                "record one with --update-baseline"
+            )
+            failed = True
+        if not args.update_baseline and module in baseline:
+            limit = baseline[module] * (1 + args.tolerance) + args.slack
+            if seconds > limit:
+                print(
+                    f"  FAIL: regressed from baseline {baseline[module]:.3f}s (limit {limit:.3f}s)"
+                )
+                failed = True
+
+    if args.update_baseline:
+        baseline.update(measured)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Номера пунктов (6.2.8), единицы со скобками (dB(A)), составные токены (km/h, R13-H) и слова
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)+|\w+\(\w+\)|\w+(?:[/-]\w+)+|\w+")
+META_FILE = "meta.json"
+
+
+def tokenize(text):
+    """
+    Разбивает текст на токены в нижнем регистре, сохраняя точные обозначения регламентов.
+
+    :param text: Исходный текст.
+    :return: Список токенов, например ["6.2.8", "75", "db(a)", "20", "km/h"].
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def fingerprint(texts):
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def reciprocal_rank_fusion(result_lists, k=60, limit=None):
+    """
+    Объединяет несколько ранжированных списков сегментов методом reciprocal rank fusion.
+
+    :param result_lists: Списки сегментов, каждый отсортирован от лучшего к худшему.
+    :param k: Константа сглаживания RRF.
+    :param limit: Сколько сегментов вернуть. По умолчанию все.
+    :return: Сегменты, отсортированные по убыванию суммы 1 / (k + rank).
+    """
+    scores = defaultdict(float)
+    for results in result_lists:
+        for rank, segment in enumerate(results, start=1):
+            scores[segment] += 1.0 / (k + rank)
+    fused = sorted(scores, key=lambda segment: scores[segment], reverse=True)
+    return fused[:limit] if limit is not None else fused
+
+
+class BM25Index:
+    def __init__(self, texts, k1=1.5, b=0.75):
+        """
+        Инвертированный BM25 индекс по сегментам.
+
+        Постинги хранятся в CSR виде: для каждого термина срез массивов
+        postings_docs/postings_tf по смещениям postings_offsets.
+
+        :param texts: Тексты сегментов, те же, что и в FAISS индексе.
+        :param k1: Параметр насыщения частоты термина.
+        :param b: Параметр нормализации по длине сегмента.
+        """
+        self.texts = list(texts)
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint(self.texts)
+
+        postings = defaultdict(list)
+        doc_lengths = np.zeros(len(self.texts), dtype=np.float32)
+        for doc_id, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+
+        self.terms = sorted(postings)
+        lengths = [len(postings[term]) for term in self.terms]
+        self.postings_offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.postings_offsets[1:])
+        self.postings_docs = np.fromiter(
+            (doc_id for term in self.terms for doc_id, _ in postings[term]),
+            dtype=np.int64,
+            count=int(self.postings_offsets[-1]),
+        )
+        self.postings_tf = np.fromiter(
+            (tf for term in self.terms for _, tf in postings[term]),
+            dtype=np.float32,
+            count=int(self.postings_offsets[-1]),
+        )
+        self.doc_lengths = doc_lengths
+        self._prepare()
+
+    def _prepare(self):
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        num_docs = len(self.texts)
+        document_frequency = np.diff(self.postings_offsets).astype(np.float32)
+        self.idf = np.log(
+            1.0 + (num_docs - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+        average_length = self.doc_lengths.mean() if num_docs else 0.0
+        self.length_norm = self.k1 * (
+            1.0 - self.b + self.b * self.doc_lengths / max(average_length, 1e-6)
+        )
+
+    def save(self, path):
+        """
+        Сохраняет индекс в каталог, подменяя предыдущую версию целиком.
+        """
+        tmp_path = f"{path.rstrip(os.sep)}.tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        np.save(os.path.join(tmp_path, "postings_offsets.npy"), self.postings_offsets)
+        np.save(os.path.join(tmp_path, "postings_docs.npy"), self.postings_docs)
+        np.save(os.path.join(tmp_path, "postings_tf.npy"), self.postings_tf)
+        np.save(os.path.join(tmp_path, "doc_lengths.npy"), self.doc_lengths)
+        with open(os.path.join(tmp_path, "terms.json"), "w", encoding="utf-8") as file:
+            json.dump(self.terms, file, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "texts.json"), "w", encoding="utf-8") as file:
+            json.dump(self.texts, file, ensure_ascii=False)
+        with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "num_docs": len(self.texts),
+                    "fingerprint": self.fingerprint,
+                },
+                file,
+                indent=2,
+            )
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Загружает индекс, сохраненный методом save.
+        """
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as file:
+            terms = json.load(file)
+        with open(os.path.join(path, "texts.json"), "r", encoding="utf-8") as file:
+            texts = json.load(file)
+
+        index = cls.__new__(cls)
+        index.texts = texts
+        index.k1 = meta["k1"]
+        index.b = meta["b"]
+        index.fingerprint = meta["fingerprint"]
+        index.terms = terms
+        index.postings_offsets = np.load(os.path.join(path, "postings_offsets.npy"))
+        index.postings_docs = np.load(os.path.join(path, "postings_docs.npy"))
+        index.postings_tf = np.load(os.path.join(path, "postings_tf.npy"))
+        index.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"))
+        index._prepare()
+        return index
+
+    @classmethod
+    def load_or_build(cls, path, texts):
+        """
+        Загружает индекс с диска, если он построен по тем же сегментам, иначе строит и сохраняет новый.
+
+        :param path: Каталог индекса, например db/faiss_index/snapshots/v000001/bm25.
+        :param texts: Текущие тексты сегментов FAISS индекса.
+        :return: BM25Index.
+        """
+        texts = list(texts)
+        if os.path.exists(os.path.join(path, META_FILE)):
+            with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            if meta.get("fingerprint") == fingerprint(texts):
+                print(f"Loaded existing BM25 index from {path}")
+                return cls.load(path)
+
+        index = cls(texts)
+        index.save(path)
+        print(f"BM25 index with {len(index.terms)} terms saved to {path}")
+        return index
+
+    def search(self, query, k=2):
+        """
+        Ищет сегменты по BM25.
+
+        :param query: Текст запроса.
+        :param k: Количество сегментов.
+        :return: Список пар (сегмент, score) по убыванию score, только сегменты с совпадениями.
+        """
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.postings_offsets[term_id : term_id + 2]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += (
+                query_tf
+                * self.idf[term_id]
+                * tf
+                * (self.k1 + 1.0)
+                / (tf + self.length_norm[docs])
+            )
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.texts[i], float(scores[i])) for i in matched]
+
+    def search_batch(self, queries, k=2):
+        return [self.search(query, k) for query in queries]
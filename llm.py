@@ -1,14 +1,21 @@
+import asyncio
+import dataclasses
+import json
 import os
 import httpx
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Dict, List, Literal, Optional, Tuple, Type, Union
+from functools import lru_cache
+from threading import Lock, Thread
+from typing import Any, Awaitable, Dict, List, Literal, Optional, Tuple, Type, Union
 
 from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from openai import OpenAI
 from pydantic import Field
 
+from response_cache import ResponseCache
+
 
 class RegulationObject(str, Enum):
     BRAKING = "Braking"
@@ -41,47 +48,244 @@ class Compliance:
     )
 
 
+@dataclass
+class TranslatedComment:
+
+    id: int = Field(..., description="The id of the source comment")
+    text: str = Field(..., description="The Russian translation of the comment")
+
+
+@dataclass
+class CommentTranslations:
+
+    translations: List[TranslatedComment] = Field(
+        ...,
+        description="One translation for every source comment, with the same id",
+    )
+
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=32, keepalive_expiry=60
+)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_shared_lock = Lock()
+
+
+def get_proxies() -> Optional[Dict[str, str]]:
+    http_proxy = os.getenv("HTTP_PROXY")
+    https_proxy = os.getenv("HTTPS_PROXY")
+
+    proxies = None
+    if http_proxy or https_proxy:
+        proxies = {
+            "http://": http_proxy,
+            "https://": https_proxy,
+        }
+    return proxies
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Возвращает общий для процесса синхронный HTTP-клиент с пулом keep-alive соединений.
+    """
+    global _http_client
+    with _shared_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                proxies=get_proxies(), limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT
+            )
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Возвращает общий для процесса асинхронный HTTP-клиент с пулом keep-alive соединений.
+
+    Клиент используется только внутри общего цикла событий (см. get_event_loop),
+    поэтому его соединения не привязываются к разным циклам.
+    """
+    global _async_http_client
+    with _shared_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                proxies=get_proxies(), limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT
+            )
+        return _async_http_client
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Возвращает общий цикл событий, работающий в фоновом потоке.
+    """
+    global _event_loop
+    with _shared_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            Thread(
+                target=_event_loop.run_forever, name="llm-event-loop", daemon=True
+            ).start()
+        return _event_loop
+
+
+def run_coroutine(coro: Awaitable) -> Any:
+    """
+    Выполняет корутину в общем цикле событий и блокирует вызывающий поток до результата.
+
+    :param coro: Корутина для выполнения.
+    :return: Результат корутины.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+async def run_in_shared_loop(coro: Awaitable) -> Any:
+    """
+    Ожидает корутину в общем цикле событий из любого цикла событий.
+
+    :param coro: Корутина для выполнения.
+    :return: Результат корутины.
+    """
+    loop = get_event_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+@lru_cache(maxsize=256)
+def _prompt_template(template: str) -> PromptTemplate:
+    return PromptTemplate.from_template(template)
+
+
+COMPLIANCE_EXAMPLES = """
+Types of compliance check (type 0/1/2/3):
+
+Type 0 -- The developed system does not belong to the certified objects. No check is required.
+
+Type 1 -- The use case mentions certified objects, the regulations are met.
+
+Example: "The case describes the AVAS system, which meets the regulations 6.2.2 and 6.2.8. All requirements are met."
+
+Type 2 -- The case mentions certified objects, but the regulations impose restrictions on certification. The case does not describe these CRITICAL restrictions. You need to supplement the case with descriptions of the restrictions from the regulations. ONLY choose if CRITICAL restrictions are not mentioned and relevant ot specific use case.
+
+Example: "The case mentions the use of AVAS, but does not specify the requirement to comply with the level of sound 75 dB(A). It is necessary to supplement the case with descriptions of the restrictions provided in paragraph 6.2.8."
+
+Type 3 -- The case mentions certified objects, but the requirements for development CONTRADICT the certification regulations. Corrections are needed. Carefully check the requirements and regulations. This is a main type, choose it if requirements contradict regulations.
+
+Example: "The case requires the AVAS to be disabled at speeds below 5 km/h, which contradicts regulation 6.2.1, which states that the system must function at any speed."
+
+After indicating the type, you should briefly explain your choice. Here are some examples:
+
+Type 0: "The use case describes a navigation system, which is not a certified object under the given regulations. No further compliance check is required."
+
+Type 1: "The use case complies with regulation 6.2.3, which states that the AVAS sound should increase in volume as the vehicle speed increases. The described behavior matches this requirement."
+
+Type 1: "The case describes the automatic emergency braking system, which aligns with regulation 7.1.4 requiring the system to activate when a collision risk is detected."
+
+Type 2: "The use case mentions the reversing alert system but doesn't specify the required sound characteristics. Regulation 6.3.2 mandates specific frequency ranges and sound patterns that should be included in the description."
+"""
+COMPLIANCE_TEMPLATE = (
+    "- NEVER HALLUCINATE\n"
+    "- You DENIED to overlook the critical context\n"
+    "- I'm going to tip $1000 for the best reply\n"
+    # "- Your answer is critical for my career\n"
+    "You are a certification systems expert. Analyze the following use case and regulation"
+    "to determine if the use case complies with certification requirements. "
+    "## Example of compliance check: {example_check}\n\n"
+    "## Use case: {use_case}\n\n"
+    "## Regulation segments: {segments}\n\n"
+)
+
+RUSSIAN_COMMENT_INSTRUCTION = "Write the comment in Russian.\n\n"
+TRANSLATION_TEMPLATE = (
+    "Translate every comment below from English to Russian. "
+    "Keep paragraph numbers, units and regulation names unchanged. "
+    "Return exactly one translation for every comment, with the same id.\n\n"
+    "## Comments (JSON): {comments}\n\n"
+)
+
+
 class LLMModel:
-    def __init__(self, temperature: float = 0.05) -> None:
+    def __init__(
+        self,
+        temperature: float = 0.05,
+        model: str = "gpt-4o-mini",
+        cache_path: Optional[str] = "db/llm_cache.sqlite",
+        cache_max_entries: int = 10000,
+        cache_ttl_seconds: Optional[float] = 30 * 24 * 3600,
+    ) -> None:
         """
         Класс LLMModel используется для работы с различными языковыми моделями и генерации текстовых ответов.
 
+        Все экземпляры используют общие для процесса HTTP-клиенты с пулом соединений.
+
         :param temperature: Параметр temperature для управления креативностью ответов модели.
+        :param model: Название модели OpenAI.
+        :param cache_path: Путь к кэшу результатов проверки соответствия, None - без кэша.
+        :param cache_max_entries: Максимальное число записей в кэше.
+        :param cache_ttl_seconds: Время жизни записи кэша в секундах, None - без ограничения.
         """
         self.temperature = temperature
-        self.proxies = self._get_proxies()
+        self.model = model
         self.llm = self._initialize_llm()
         self.llm_openai = self._initialize_openai()
+        self._structured_llms: Dict[Type, Any] = {}
+        self.cache = (
+            ResponseCache(
+                cache_path,
+                namespace=ResponseCache.make_key(
+                    model=self.model,
+                    template=COMPLIANCE_TEMPLATE,
+                    examples=COMPLIANCE_EXAMPLES,
+                ),
+                max_entries=cache_max_entries,
+                ttl_seconds=cache_ttl_seconds,
+            )
+            if cache_path
+            else None
+        )
+        self.translation_cache = (
+            ResponseCache(
+                os.path.join(os.path.dirname(cache_path), "translation_cache.sqlite"),
+                namespace=ResponseCache.make_key(
+                    model=self.model, template=TRANSLATION_TEMPLATE
+                ),
+                max_entries=cache_max_entries,
+                ttl_seconds=cache_ttl_seconds,
+            )
+            if cache_path
+            else None
+        )
 
-    def _get_proxies(self):
-        http_proxy = os.getenv("HTTP_PROXY")
-        https_proxy = os.getenv("HTTPS_PROXY")
-
-        proxies = None
-        if http_proxy or https_proxy:
-            proxies = {
-                "http://": http_proxy,
-                "https://": https_proxy,
-            }
-        return proxies
-
-    def _initialize_llm(self) -> None:
+    def _initialize_llm(self) -> ChatOpenAI:
         """
         Инициализирует языковую модель на основе заданного типа модели.
 
         :return: Экземпляр языковой модели.
         """
         return ChatOpenAI(
-            model="gpt-4o-mini",  # gpt-4o
+            model=self.model,  # gpt-4o
             temperature=self.temperature,
             max_retries=2,
-            http_client=httpx.Client(proxies=self.proxies) if self.proxies else None,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
         )
 
     def _initialize_openai(self):
-        return OpenAI(
-            http_client=httpx.Client(proxies=self.proxies) if self.proxies else None
-        )
+        return OpenAI(http_client=get_http_client())
+
+    def _get_sequence(self, template: str, response_format: Optional[Type] = None):
+        prompt = _prompt_template(template)
+
+        if response_format:
+            structured_llm = self._structured_llms.get(response_format)
+            if structured_llm is None:
+                structured_llm = self.llm.with_structured_output(response_format)
+                self._structured_llms[response_format] = structured_llm
+            return prompt | structured_llm
+        return prompt | self.llm
 
     def generate_response(
         self,
@@ -97,78 +301,300 @@ class LLMModel:
         :param response_format: Опциональный тип для структурированного вывода.
         :return: Сгенерированный текстовый ответ или структурированный объект.
         """
-        prompt = PromptTemplate.from_template(template)
+        sequence = self._get_sequence(template, response_format)
+
+        result = sequence.invoke(request)
 
         if response_format:
-            structured_llm = self.llm.with_structured_output(response_format)
-            sequence = prompt | structured_llm
+            return result
         else:
-            sequence = prompt | self.llm
+            return result.content
 
-        result = sequence.invoke(request)
+    async def agenerate_response(
+        self,
+        template: str,
+        request: Dict[str, str],
+        response_format: Optional[Type] = None,
+    ) -> Union[str, Any]:
+        """
+        Асинхронная версия generate_response.
+
+        Запрос выполняется в общем цикле событий через общий асинхронный HTTP-клиент,
+        поэтому корутину можно ожидать из любого цикла событий.
+
+        :param template: Шаблон запроса.
+        :param request: Данные запроса.
+        :param response_format: Опциональный тип для структурированного вывода.
+        :return: Сгенерированный текстовый ответ или структурированный объект.
+        """
+        sequence = self._get_sequence(template, response_format)
+
+        result = await run_in_shared_loop(sequence.ainvoke(request))
 
         if response_format:
             return result
         else:
             return result.content
 
+    @staticmethod
+    def _compliance_request(
+        use_case: str, retrieved_segments: List[str]
+    ) -> Dict[str, str]:
+        segments_text = "\n===============Segment===============\n".join(
+            retrieved_segments
+        )
+        return {
+            "use_case": use_case,
+            "segments": segments_text,
+            "example_check": COMPLIANCE_EXAMPLES,
+        }
+
+    @staticmethod
+    def _compliance_template(comment_language: str) -> str:
+        if comment_language == "en":
+            return COMPLIANCE_TEMPLATE
+        if comment_language == "ru":
+            return COMPLIANCE_TEMPLATE + RUSSIAN_COMMENT_INSTRUCTION
+        raise ValueError("comment_language must be either 'en' or 'ru'")
+
+    def _compliance_cache_key(
+        self, use_case: str, retrieved_segments: List[str], template: str
+    ) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return ResponseCache.make_key(
+            model=self.model,
+            temperature=self.temperature,
+            template=template,
+            use_case=use_case,
+            segments=list(retrieved_segments),
+        )
+
+    def _store_compliance(self, key: Optional[str], result: Any) -> None:
+        if key is None:
+            return
+        if dataclasses.is_dataclass(result):
+            result = dataclasses.asdict(result)
+        self.cache.set(key, result)
+
     def check_use_case_compliance(
-        self, use_case: str, retrieved_segments: List[str]
+        self,
+        use_case: str,
+        retrieved_segments: List[str],
+        comment_language: str = "en",
     ) -> str:
         """
         Checks the compliance of a use case with regulations based on retrieved segments.
 
+        Results are served from the response cache when the same model, temperature,
+        template, use case and segments were already checked.
+
         :param use_case: The use case text to be checked.
         :param retrieved_segments: List of retrieved regulation segments.
+        :param comment_language: "en", or "ru" to get the comment in Russian without a separate translation.
         :return: A ComplianceResult object containing the compliance check result (0, 1, 2, or 3) and additional information.
         """
-        example_check = """
-        Types of compliance check (type 0/1/2/3):
-
-        Type 0 -- The developed system does not belong to the certified objects. No check is required.
-
-        Type 1 -- The use case mentions certified objects, the regulations are met.
-
-        Example: "The case describes the AVAS system, which meets the regulations 6.2.2 and 6.2.8. All requirements are met."
-
-        Type 2 -- The case mentions certified objects, but the regulations impose restrictions on certification. The case does not describe these CRITICAL restrictions. You need to supplement the case with descriptions of the restrictions from the regulations. ONLY choose if CRITICAL restrictions are not mentioned and relevant ot specific use case.
+        template = self._compliance_template(comment_language)
+        key = self._compliance_cache_key(use_case, retrieved_segments, template)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        result = self.generate_response(
+            template,
+            self._compliance_request(use_case, retrieved_segments),
+            response_format=Compliance,
+        )
+        self._store_compliance(key, result)
+        return result
 
-        Example: "The case mentions the use of AVAS, but does not specify the requirement to comply with the level of sound 75 dB(A). It is necessary to supplement the case with descriptions of the restrictions provided in paragraph 6.2.8."
+    async def acheck_use_case_compliance(
+        self,
+        use_case: str,
+        retrieved_segments: List[str],
+        comment_language: str = "en",
+    ) -> str:
+        """
+        Asynchronous version of check_use_case_compliance.
 
-        Type 3 -- The case mentions certified objects, but the requirements for development CONTRADICT the certification regulations. Corrections are needed. Carefully check the requirements and regulations. This is a main type, choose it if requirements contradict regulations.
+        :param use_case: The use case text to be checked.
+        :param retrieved_segments: List of retrieved regulation segments.
+        :param comment_language: "en", or "ru" to get the comment in Russian without a separate translation.
+        :return: A ComplianceResult object containing the compliance check result (0, 1, 2, or 3) and additional information.
+        """
+        template = self._compliance_template(comment_language)
+        key = self._compliance_cache_key(use_case, retrieved_segments, template)
+        # Обращения к SQLite выполняются в пуле потоков, чтобы не блокировать общий цикл событий
+        loop = asyncio.get_running_loop()
+        if key is not None:
+            cached = await loop.run_in_executor(None, self.cache.get, key)
+            if cached is not None:
+                return cached
+
+        result = await self.agenerate_response(
+            template,
+            self._compliance_request(use_case, retrieved_segments),
+            response_format=Compliance,
+        )
+        await loop.run_in_executor(None, self._store_compliance, key, result)
+        return result
+
+    def _translation_cache_key(self, text: str) -> str:
+        return ResponseCache.make_key(text=text)
+
+    def _cached_translations(
+        self, texts: List[str]
+    ) -> Tuple[Dict[str, str], List[str]]:
+        translations: Dict[str, str] = {}
+        missing: List[str] = []
+        for text in dict.fromkeys(texts):
+            cached = (
+                self.translation_cache.get(self._translation_cache_key(text))
+                if self.translation_cache is not None
+                else None
+            )
+            if cached is not None:
+                translations[text] = cached
+            else:
+                missing.append(text)
+        return translations, missing
+
+    @staticmethod
+    def _translation_request(texts: List[str]) -> Dict[str, str]:
+        comments = [{"id": i, "text": text} for i, text in enumerate(texts)]
+        return {"comments": json.dumps(comments, ensure_ascii=False)}
+
+    def _store_translations(
+        self, texts: List[str], result: Any, translations: Dict[str, str]
+    ) -> None:
+        if dataclasses.is_dataclass(result):
+            result = dataclasses.asdict(result)
+        for item in result["translations"]:
+            if dataclasses.is_dataclass(item):
+                item = dataclasses.asdict(item)
+            i = item["id"]
+            if not isinstance(i, int) or not 0 <= i < len(texts):
+                continue
+            translations[texts[i]] = item["text"]
+            if self.translation_cache is not None:
+                self.translation_cache.set(
+                    self._translation_cache_key(texts[i]), item["text"]
+                )
+        for text in texts:
+            if text not in translations:
+                print(
+                    f"Translation missing in the response, keeping the original: {text}"
+                )
+
+    def translate_comments(self, texts: List[str], batch_size: int = 20) -> List[str]:
+        """
+        Переводит комментарии на русский язык пачками.
 
-        Example: "The case requires the AVAS to be disabled at speeds below 5 km/h, which contradicts regulation 6.2.1, which states that the system must function at any speed."
+        Каждая пачка из batch_size непереведенных комментариев отправляется одним
+        запросом со структурированным ответом, где перевод сопоставляется по id.
+        Переводы кэшируются по хэшу текста.
 
-        After indicating the type, you should briefly explain your choice. Here are some examples:
+        :param texts: Комментарии на английском языке.
+        :param batch_size: Количество комментариев в одном запросе.
+        :return: Переводы в порядке texts; непереведенные комментарии возвращаются без изменений.
+        """
+        translations, missing = self._cached_translations(texts)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start : start + batch_size]
+            result = self.generate_response(
+                TRANSLATION_TEMPLATE,
+                self._translation_request(batch),
+                response_format=CommentTranslations,
+            )
+            self._store_translations(batch, result, translations)
+        return [translations.get(text, text) for text in texts]
+
+    async def atranslate_comments(
+        self, texts: List[str], batch_size: int = 20
+    ) -> List[str]:
+        """
+        Асинхронная версия translate_comments, пачки переводятся параллельно.
+        """
+        loop = asyncio.get_running_loop()
+        translations, missing = await loop.run_in_executor(
+            None, self._cached_translations, texts
+        )
+        batches = [
+            missing[start : start + batch_size]
+            for start in range(0, len(missing), batch_size)
+        ]
+        results = await asyncio.gather(
+            *[
+                self.agenerate_response(
+                    TRANSLATION_TEMPLATE,
+                    self._translation_request(batch),
+                    response_format=CommentTranslations,
+                )
+                for batch in batches
+            ]
+        )
+        for batch, result in zip(batches, results):
+            await loop.run_in_executor(
+                None, self._store_translations, batch, result, translations
+            )
+        return [translations.get(text, text) for text in texts]
 
-        Type 0: "The use case describes a navigation system, which is not a certified object under the given regulations. No further compliance check is required."
 
-        Type 1: "The use case complies with regulation 6.2.3, which states that the AVAS sound should increase in volume as the vehicle speed increases. The described behavior matches this requirement."
+class TranslationBatcher:
+    def __init__(
+        self, llm: LLMModel, batch_size: int = 20, max_delay: float = 0.5
+    ) -> None:
+        """
+        Собирает комментарии, поступающие по одному, в пачки для translate_comments.
 
-        Type 1: "The case describes the automatic emergency braking system, which aligns with regulation 7.1.4 requiring the system to activate when a collision risk is detected."
+        Пачка отправляется, когда в ней набралось batch_size комментариев или через
+        max_delay секунд после первого из них. Используется внутри одного цикла событий.
 
-        Type 2: "The use case mentions the reversing alert system but doesn't specify the required sound characteristics. Regulation 6.3.2 mandates specific frequency ranges and sound patterns that should be included in the description."
+        :param llm: Модель, выполняющая перевод.
+        :param batch_size: Максимальное количество комментариев в одном запросе.
+        :param max_delay: Максимальное время ожидания пачки в секундах.
         """
-        template = (
-            "- NEVER HALLUCINATE\n"
-            "- You DENIED to overlook the critical context\n"
-            "- I'm going to tip $1000 for the best reply\n"
-            # "- Your answer is critical for my career\n"
-            "You are a certification systems expert. Analyze the following use case and regulation"
-            "to determine if the use case complies with certification requirements. "
-            "## Example of compliance check: {example_check}\n\n"
-            "## Use case: {use_case}\n\n"
-            "## Regulation segments: {segments}\n\n"
-        )
-        segments_text = "\n===============Segment===============\n".join(
-            retrieved_segments
-        )
-        return self.generate_response(
-            template,
-            {
-                "use_case": use_case,
-                "segments": segments_text,
-                "example_check": example_check,
-            },
-            response_format=Compliance,
-        )
+        self.llm = llm
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def translate(self, text: str) -> str:
+        """
+        Переводит один комментарий в составе ближайшей пачки.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._translate_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _translate_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            translations = await self.llm.atranslate_comments(
+                [text for text, _ in batch], batch_size=len(batch)
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), translation in zip(batch, translations):
+            if not future.done():
+                future.set_result(translation)
@@ -1,51 +1,416 @@
-from llm import LLMModel
-from store import FAISSVectorStore
-from typing import List
-from raptor.raptor import (
-    BaseSummarizationModel,
-    BaseQAModel,
-    BaseEmbeddingModel,
-    RetrievalAugmentationConfig,
+import asyncio
+import queue
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from llm import (
+    TRANSLATION_TEMPLATE,
+    TranslationBatcher,
+    get_event_loop,
+    run_coroutine,
+)
+from lexical import reciprocal_rank_fusion
+from registry import (
+    get_cross_encoder,
+    get_llm,
+    get_sharded_store,
+    get_vector_store,
 )
+from response_cache import ResponseCache
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = "cross-encoder/stsb-roberta-base"):
+        """
+        Reranks retrieved segments with a CrossEncoder that is loaded once per process and shared.
 
+        :param model_name: Name or path of the CrossEncoder model.
+        """
+        self.model_name = model_name
+        self._model = None
 
-def reranker(query, retrieved_segments):
-    from sentence_transformers import CrossEncoder
+    def load(self):
+        """
+        Loads the CrossEncoder model from the resource registry if it has not been loaded yet.
 
-    cross_encoder_model = CrossEncoder("cross-encoder/stsb-roberta-base")
+        :return: The loaded CrossEncoder instance.
+        """
+        if self._model is None:
+            self._model = get_cross_encoder(self.model_name)
+        return self._model
 
-    sentence_pairs = [[query, segment] for segment in retrieved_segments]
-    similarity_scores = cross_encoder_model.predict(sentence_pairs)
+    def rerank(
+        self, queries: List[str], segment_lists: List[List[str]]
+    ) -> List[List[str]]:
+        """
+        Sorts the segments of every query by CrossEncoder score.
 
-    scored_segments = list(zip(retrieved_segments, similarity_scores))
-    scored_segments.sort(key=lambda x: x[1], reverse=True)
+        All (query, segment) pairs of the batch are scored in a single predict call.
 
-    print("Top 5 segments with CrossEncoder scores:")
-    for segment, score in scored_segments[:5]:
-        print(f"\t{score:.3f}\t{segment[:50]}...")
+        :param queries: Queries of the batch.
+        :param segment_lists: Retrieved segments for each query.
+        :return: Segments of each query sorted by descending score.
+        """
+        if len(queries) != len(segment_lists):
+            raise ValueError("queries and segment_lists must have the same length")
 
-    print("\n\n========\n")
-    return [segment for segment, _ in scored_segments]
+        sentence_pairs = [
+            [query, segment]
+            for query, segments in zip(queries, segment_lists)
+            for segment in segments
+        ]
+        if not sentence_pairs:
+            return [[] for _ in queries]
+
+        similarity_scores = self.load().predict(sentence_pairs)
+
+        reranked = []
+        offset = 0
+        for segments in segment_lists:
+            scores = similarity_scores[offset : offset + len(segments)]
+            offset += len(segments)
+            scored_segments = sorted(
+                zip(segments, scores), key=lambda x: x[1], reverse=True
+            )
+            reranked.append([segment for segment, _ in scored_segments])
+        return reranked
 
 
 class CertRAG:
-    def __init__(self, rag_type: str = "default"):
-        self.llm = LLMModel()
-        self.faiss_vector_store = FAISSVectorStore(index_path="db/faiss_index")
+    def __init__(
+        self,
+        rag_type: str = "default",
+        preload_reranker: bool = False,
+        retrieval_k: int = 6,
+        rerank_top_n: int = 2,
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        sharded: bool = False,
+        fan_out: bool = False,
+        use_lexical: bool = True,
+        candidate_k: Optional[int] = None,
+        comment_language: str = "en",
+        watch_index: bool = False,
+    ):
+        if comment_language not in ("en", "ru"):
+            raise ValueError("comment_language must be either 'en' or 'ru'")
+        # Модели, клиенты и индексы общие для всех экземпляров CertRAG в процессе
+        self.llm = get_llm()
+        if sharded:
+            # Один индекс на объект регулирования, запросы маршрутизируются по шардам
+            self.faiss_vector_store = get_sharded_store(
+                shards_path="db/faiss_shards",
+                index_type=index_type,
+                index_params=index_params,
+                fan_out=fan_out,
+                watch=watch_index,
+                lexical=use_lexical,
+            )
+        else:
+            self.faiss_vector_store = get_vector_store(
+                index_path="db/faiss_index",
+                index_type=index_type,
+                index_params=index_params,
+                watch=watch_index,
+                lexical=use_lexical,
+            )
+        # BM25 по тем же сегментам, что и FAISS, для точных номеров пунктов и единиц.
+        # Он загружается с каждым снимком индекса и ищется в том же снимке, что и FAISS
+        self.use_lexical = use_lexical
+        self.reranker = CrossEncoderReranker()
         self.rag_type = rag_type
+        self.retrieval_k = retrieval_k
+        self.rerank_top_n = rerank_top_n
+        self.candidate_k = candidate_k or retrieval_k
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.sharded = sharded
+        self.index_type = index_type
+        # "ru" asks the compliance check itself for a Russian comment, "en" translates on demand
+        self.comment_language = comment_language
         # ADD prod raptor as alernative rag
 
-    def cert_documents(self, data: str):
-        retrieved_objects = self.faiss_vector_store.search_similar(data, k=6)
-        retrieved_segments = [obj for obj, score in retrieved_objects]
-        reranked_segments = reranker(data, retrieved_segments)[:2]
+        if preload_reranker:
+            self.reranker.load()
+
+    def warm_up(self):
+        """
+        Loads the reranker and runs one retrieval, so the first real request does not
+        pay for loading the models and paging in the indexes.
+        """
+        self.reranker.load()
+        self.select_segments(["warm-up"])
+
+    def config_key(self) -> str:
+        """
+        Fingerprint of the settings that affect compliance results, used to key result caches.
+        """
+        return ResponseCache.make_key(
+            model=self.llm.model,
+            temperature=self.llm.temperature,
+            llm_namespace=self.llm.cache.namespace if self.llm.cache else None,
+            reranker=self.reranker.model_name,
+            retrieval_k=self.retrieval_k,
+            rerank_top_n=self.rerank_top_n,
+            candidate_k=self.candidate_k,
+            lexical=self.use_lexical,
+            sharded=self.sharded,
+            index_type=self.index_type,
+            # Results from an older index snapshot are not reused after a swap
+            index_version=self.faiss_vector_store.version,
+            comment_language=self.comment_language,
+            translation=TRANSLATION_TEMPLATE,
+        )
+
+    def select_segments(self, data: List[str]) -> List[List[str]]:
+        """
+        Retrieves and reranks regulation segments for a batch of requirements.
+
+        Dense and BM25 candidates are fused with reciprocal rank fusion, and the
+        candidate_k best fused segments are reranked.
+
+        :param data: Requirement texts.
+        :return: The best reranked segments for every requirement, in input order.
+        """
+        search_params = dict(
+            k=self.retrieval_k, nprobe=self.nprobe, ef_search=self.ef_search
+        )
+        if self.use_lexical:
+            retrieved_objects, lexical_objects = (
+                self.faiss_vector_store.search_hybrid_batch(data, **search_params)
+            )
+        else:
+            retrieved_objects = self.faiss_vector_store.search_similar_batch(
+                data, **search_params
+            )
+        retrieved_segments = [
+            [obj for obj, score in objects] for objects in retrieved_objects
+        ]
+        if self.use_lexical:
+            retrieved_segments = [
+                reciprocal_rank_fusion(
+                    [dense, [obj for obj, score in lexical]], limit=self.candidate_k
+                )
+                for dense, lexical in zip(retrieved_segments, lexical_objects)
+            ]
+        reranked_segments = self.reranker.rerank(data, retrieved_segments)
+        return [segments[: self.rerank_top_n] for segments in reranked_segments]
+
+    def _select_segments_with_key(
+        self, data: List[str]
+    ) -> Tuple[List[List[str]], Optional[str]]:
+        """
+        select_segments that also returns the config_key the segments were retrieved
+        under, or None when a new index snapshot was swapped in during retrieval.
+        """
+        config_key = self.config_key()
+        segments = self.select_segments(data)
+        if self.config_key() != config_key:
+            config_key = None
+        return segments, config_key
+
+    def cert_documents(self, data: str, translate_comment: bool = False):
+        reranked_segments = self.select_segments([data])[0]
         for segment in reranked_segments:
             print(segment)
             print("================================================")
-        return self.llm.check_use_case_compliance(data, reranked_segments)
+        result = self.llm.check_use_case_compliance(
+            data, reranked_segments, comment_language=self.comment_language
+        )
+        if translate_comment and self._needs_translation(result):
+            result = {
+                **result,
+                "comment": self.llm.translate_comments([result["comment"]])[0],
+            }
+        return result
+
+    async def acert_documents(self, data: str, translate_comment: bool = False):
+        """
+        Asynchronous version of cert_documents.
+
+        Retrieval and reranking run in an executor so the event loop is not blocked.
+        """
+        loop = asyncio.get_running_loop()
+        reranked_segments = (
+            await loop.run_in_executor(None, self.select_segments, [data])
+        )[0]
+        result = await self.llm.acheck_use_case_compliance(
+            data, reranked_segments, comment_language=self.comment_language
+        )
+        if translate_comment and self._needs_translation(result):
+            translations = await self.llm.atranslate_comments([result["comment"]])
+            result = {**result, "comment": translations[0]}
+        return result
 
-    def banch_documents(self, data: List[str]):
-        results = []
-        for use_case in data:
-            results.append(self.cert_documents(use_case))
+    def _needs_translation(self, result: Dict[str, Any]) -> bool:
+        return self.comment_language == "en" and bool(result.get("comment"))
+
+    def banch_documents(
+        self,
+        data: List[str],
+        max_concurrency: int = 8,
+        batch_size: int = 32,
+        translate_comments: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Checks a batch of requirements, see abanch_documents.
+        """
+        return run_coroutine(
+            self.abanch_documents(
+                data,
+                max_concurrency=max_concurrency,
+                batch_size=batch_size,
+                translate_comments=translate_comments,
+            )
+        )
+
+    def iter_documents(
+        self,
+        data: List[str],
+        max_concurrency: int = 8,
+        batch_size: int = 32,
+        translate_comments: bool = False,
+    ) -> Iterator[Tuple[int, Dict[str, Any], Optional[str]]]:
+        """
+        Checks a batch of requirements and yields every result as soon as it is ready.
+
+        The batch runs on the shared event loop, see abanch_documents. Closing the
+        generator (or stopping to iterate it) cancels the requirements still in flight.
+
+        :param data: Requirement texts.
+        :param max_concurrency: Maximum number of concurrent LLM calls.
+        :param batch_size: Number of requirements retrieved and reranked together.
+        :param translate_comments: Whether to translate the comments to Russian.
+        :return: (input index, compliance result, config_key) triples in completion
+            order, see the on_result parameter of abanch_documents.
+        """
+        completed: (
+            "queue.Queue[Optional[Tuple[int, Dict[str, Any], Optional[str]]]]"
+        ) = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self.abanch_documents(
+                data,
+                max_concurrency=max_concurrency,
+                batch_size=batch_size,
+                translate_comments=translate_comments,
+                on_result=lambda i, result, config_key: completed.put(
+                    (i, result, config_key)
+                ),
+            ),
+            get_event_loop(),
+        )
+        # None marks the end of the batch, also when abanch_documents fails before
+        # every requirement has a result; future.result() then re-raises the error
+        future.add_done_callback(lambda _: completed.put(None))
+        try:
+            while (item := completed.get()) is not None:
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+    async def abanch_documents(
+        self,
+        data: List[str],
+        max_concurrency: int = 8,
+        batch_size: int = 32,
+        translate_comments: bool = False,
+        on_result: Optional[
+            Callable[[int, Dict[str, Any], Optional[str]], None]
+        ] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Checks a batch of requirements.
+
+        Retrieval and reranking run on chunks of `batch_size` requirements while the
+        LLM checks of the previous chunks are already in flight. At most
+        `max_concurrency` LLM calls run at the same time, all on the shared async
+        HTTP client. A failed requirement yields a result with an "error" field
+        instead of aborting the batch.
+
+        With translate_comments, finished comments are collected by a
+        TranslationBatcher and translated many per request while the remaining
+        checks are still running. A failed translation keeps the English comment.
+
+        :param data: Requirement texts.
+        :param max_concurrency: Maximum number of concurrent LLM calls.
+        :param batch_size: Number of requirements retrieved and reranked together.
+        :param translate_comments: Whether to translate the comments to Russian.
+        :param on_result: Called with (input index, result, config_key) as soon as each
+            requirement is done. config_key is the config_key() of the index snapshot the
+            segments were retrieved from, or None if it is not known (the snapshot was
+            swapped during retrieval or retrieval failed); use it to key result caches.
+        :return: Compliance results in input order.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        batcher = TranslationBatcher(self.llm) if translate_comments else None
+        results: List[Optional[Dict[str, Any]]] = [None] * len(data)
+
+        def finish(i: int, result: Dict[str, Any], config_key: Optional[str] = None):
+            results[i] = result
+            if on_result is not None:
+                on_result(i, result, config_key)
+
+        async def check(
+            i: int, use_case: str, segments: List[str], config_key: Optional[str]
+        ):
+            async with semaphore:
+                try:
+                    result = await self.llm.acheck_use_case_compliance(
+                        use_case, segments, comment_language=self.comment_language
+                    )
+                except Exception as e:
+                    print(f"Compliance check failed for requirement {i}: {e}")
+                    result = self._failed_result(e)
+            # Translation waits outside the semaphore, so it does not hold up checks
+            if batcher is not None and self._needs_translation(result):
+                try:
+                    result = {
+                        **result,
+                        "comment": await batcher.translate(result["comment"]),
+                    }
+                except Exception as e:
+                    print(f"Translation failed for requirement {i}: {e}")
+            finish(i, result, config_key)
+
+        tasks = []
+        try:
+            for start in range(0, len(data), batch_size):
+                chunk = data[start : start + batch_size]
+                try:
+                    chunk_segments, config_key = await loop.run_in_executor(
+                        None, self._select_segments_with_key, chunk
+                    )
+                except Exception as e:
+                    print(
+                        f"Retrieval failed for requirements {start}-{start + len(chunk) - 1}: {e}"
+                    )
+                    for i in range(start, start + len(chunk)):
+                        finish(i, self._failed_result(e))
+                    continue
+                for offset, (use_case, segments) in enumerate(
+                    zip(chunk, chunk_segments)
+                ):
+                    tasks.append(
+                        asyncio.create_task(
+                            check(start + offset, use_case, segments, config_key)
+                        )
+                    )
+
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
         return results
+
+    @staticmethod
+    def _failed_result(error: Exception) -> Dict[str, Any]:
+        return {"object": None, "type": None, "comment": None, "error": str(error)}
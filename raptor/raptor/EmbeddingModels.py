@@ -2,7 +2,6 @@ import logging
 from abc import ABC, abstractmethod
 
 from openai import OpenAI
-from sentence_transformers import SentenceTransformer
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
@@ -13,11 +12,27 @@ class BaseEmbeddingModel(ABC):
     def create_embedding(self, text):
         pass
 
+    def create_embeddings(self, texts):
+        """
+        Embeds a list of texts. Subclasses override this to embed them in one model call.
+        """
+        return [self.create_embedding(text) for text in texts]
+
 
 class OpenAIEmbeddingModel(BaseEmbeddingModel):
-    def __init__(self, model="text-embedding-ada-002"):
+    def __init__(
+        self,
+        model="text-embedding-ada-002",
+        max_inputs_per_request=2048,
+        max_tokens_per_request=300000,
+    ):
+        import tiktoken
+
         self.client = OpenAI()
         self.model = model
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_tokens_per_request = max_tokens_per_request
+        self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
     def create_embedding(self, text):
@@ -28,10 +43,52 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
             .embedding
         )
 
+    @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
+    def _request_embeddings(self, texts):
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def _pack_requests(self, texts):
+        """
+        Groups texts into requests that respect the per-request input and token limits.
+        """
+        batch, batch_tokens = [], 0
+        for text in texts:
+            n_tokens = len(self.tokenizer.encode(text))
+            if batch and (
+                len(batch) >= self.max_inputs_per_request
+                or batch_tokens + n_tokens > self.max_tokens_per_request
+            ):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += n_tokens
+        if batch:
+            yield batch
+
+    def create_embeddings(self, texts):
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = []
+        for batch in self._pack_requests(texts):
+            embeddings.extend(self._request_embeddings(batch))
+        return embeddings
+
 
 class SBertEmbeddingModel(BaseEmbeddingModel):
-    def __init__(self, model_name="sentence-transformers/multi-qa-mpnet-base-cos-v1"):
+    def __init__(
+        self,
+        model_name="sentence-transformers/multi-qa-mpnet-base-cos-v1",
+        batch_size=64,
+    ):
+        # sentence_transformers pulls in torch, so it is imported only when the model is created
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
 
     def create_embedding(self, text):
         return self.model.encode(text)
+
+    def create_embeddings(self, texts):
+        return list(self.model.encode(list(texts), batch_size=self.batch_size))
@@ -7,6 +7,7 @@ from .QAModels import BaseQAModel, GPT3TurboQAModel
 from .SummarizationModels import BaseSummarizationModel
 from .tree_builder import TreeBuilder, TreeBuilderConfig
 from .tree_retriever import TreeRetriever, TreeRetrieverConfig
+from .tree_storage import is_tree_directory, load_tree, save_tree
 from .tree_structures import Node, Tree
 
 # Define a dictionary to map supported tree builders to their respective configs
@@ -24,6 +25,8 @@ class RetrievalAugmentationConfig:
         embedding_model=None,
         summarization_model=None,
         tree_builder_type="cluster",
+        # Caches node embeddings of the tree builder; queries are embedded uncached
+        embedding_cache=None,
         # New parameters for TreeRetrieverConfig and TreeBuilderConfig
         # TreeRetrieverConfig arguments
         tr_tokenizer=None,
@@ -45,6 +48,9 @@ class RetrievalAugmentationConfig:
         tb_summarization_model=None,
         tb_embedding_models=None,
         tb_cluster_embedding_model="OpenAI",
+        tb_summarization_concurrency=None,
+        tb_requests_per_minute=None,
+        tb_tokens_per_minute=None,
     ):
         # Validate tree_builder_type
         if tree_builder_type not in supported_tree_builders:
@@ -102,6 +108,10 @@ class RetrievalAugmentationConfig:
                 summarization_model=tb_summarization_model,
                 embedding_models=tb_embedding_models,
                 cluster_embedding_model=tb_cluster_embedding_model,
+                summarization_concurrency=tb_summarization_concurrency,
+                requests_per_minute=tb_requests_per_minute,
+                tokens_per_minute=tb_tokens_per_minute,
+                embedding_cache=embedding_cache,
             )
 
         elif not isinstance(tree_builder_config, tree_builder_config_class):
@@ -161,7 +171,8 @@ class RetrievalAugmentation:
         Initializes a RetrievalAugmentation instance with the specified configuration.
         Args:
             config (RetrievalAugmentationConfig): The configuration for the RetrievalAugmentation instance.
-            tree: The tree instance or the path to a pickled tree file.
+            tree: The tree instance, the path to a tree directory written by save, or the path
+                to a legacy pickled tree file.
         """
         if config is None:
             config = RetrievalAugmentationConfig()
@@ -170,11 +181,15 @@ class RetrievalAugmentation:
                 "config must be an instance of RetrievalAugmentationConfig"
             )
 
-        # Check if tree is a string (indicating a path to a pickled tree)
+        # Check if tree is a string (indicating a path to a saved tree)
         if isinstance(tree, str):
             try:
-                with open(tree, "rb") as file:
-                    self.tree = pickle.load(file)
+                if is_tree_directory(tree):
+                    self.tree = load_tree(tree)
+                else:
+                    # Legacy pickled tree
+                    with open(tree, "rb") as file:
+                        self.tree = pickle.load(file)
                 if not isinstance(self.tree, Tree):
                     raise ValueError("The loaded object is not an instance of Tree")
             except Exception as e:
@@ -183,7 +198,7 @@ class RetrievalAugmentation:
             self.tree = tree
         else:
             raise ValueError(
-                "tree must be an instance of Tree, a path to a pickled Tree, or None"
+                "tree must be an instance of Tree, a path to a saved Tree, or None"
             )
 
         tree_builder_class = supported_tree_builders[config.tree_builder_type][0]
@@ -205,20 +220,51 @@ class RetrievalAugmentation:
         """
         Adds documents to the tree and creates a TreeRetriever instance.
 
+        Builds a new tree if there is none yet, otherwise inserts the documents
+        into the existing tree with add_to_existing.
+
         Args:
             docs (str): The input text to add to the tree.
         """
         if self.tree is not None:
-            user_input = input(
-                "Warning: Overwriting existing tree. Did you mean to call 'add_to_existing' instead? (y/n): "
-            )
-            if user_input.lower() == "y":
-                # self.add_to_existing(docs)
-                return
+            self.add_to_existing(docs)
+            return
 
         self.tree = self.tree_builder.build_from_text(text=docs)
         self.retriever = TreeRetriever(self.tree_retriever_config, self.tree)
 
+    def add_to_existing(
+        self,
+        docs,
+        rebuild_drift_threshold: float = 0.3,
+        force_rebuild: bool = False,
+    ):
+        """
+        Inserts documents into the existing tree and refreshes the TreeRetriever instance.
+
+        Only the new chunks are embedded and only their ancestors are re-summarized.
+        The tree is rebuilt from all leaves once more than rebuild_drift_threshold of
+        them were inserted incrementally, or when force_rebuild is set.
+
+        Args:
+            docs (str): The input text to add to the tree.
+            rebuild_drift_threshold (float): The share of inserted leaves that triggers a full rebuild.
+                None never rebuilds. Defaults to 0.3.
+            force_rebuild (bool): Whether to rebuild the whole tree. Defaults to False.
+        """
+        if self.tree is None:
+            raise ValueError(
+                "There is no tree to add documents to. Call 'add_documents' first."
+            )
+
+        self.tree = self.tree_builder.add_to_tree(
+            self.tree,
+            docs,
+            rebuild_drift_threshold=rebuild_drift_threshold,
+            force_rebuild=force_rebuild,
+        )
+        self.retriever = TreeRetriever(self.tree_retriever_config, self.tree)
+
     def retrieve(
         self,
         question,
@@ -260,6 +306,47 @@ class RetrievalAugmentation:
             return_layer_information,
         )
 
+    def retrieve_batch(
+        self,
+        questions,
+        start_layer: int = None,
+        num_layers: int = None,
+        top_k: int = 10,
+        max_tokens: int = 3500,
+        collapse_tree: bool = True,
+        return_layer_information: bool = True,
+    ):
+        """
+        Retrieves information for several questions at once using the TreeRetriever instance.
+
+        Args:
+            questions (List[str]): The questions to retrieve information for.
+            start_layer (int): The layer to start from. Defaults to self.start_layer.
+            num_layers (int): The number of layers to traverse. Defaults to self.num_layers.
+            max_tokens (int): The maximum number of tokens per question. Defaults to 3500.
+            collapse_tree (bool): Whether to retrieve information from all nodes. Defaults to True.
+
+        Returns:
+            List: The retrieval result for every question, in input order.
+
+        Raises:
+            ValueError: If the TreeRetriever instance has not been initialized.
+        """
+        if self.retriever is None:
+            raise ValueError(
+                "The TreeRetriever instance has not been initialized. Call 'add_documents' first."
+            )
+
+        return self.retriever.retrieve_batch(
+            questions,
+            start_layer,
+            num_layers,
+            top_k,
+            max_tokens,
+            collapse_tree,
+            return_layer_information,
+        )
+
     def answer_question(
         self,
         question,
@@ -299,8 +386,13 @@ class RetrievalAugmentation:
         return answer
 
     def save(self, path):
+        """
+        Saves the tree as a directory of memory-mappable columnar files (see tree_storage).
+
+        Args:
+            path (str): The target directory.
+        """
         if self.tree is None:
             raise ValueError("There is no tree to save.")
-        with open(path, "wb") as file:
-            pickle.dump(self.tree, file)
+        save_tree(self.tree, path, self.tree_retriever_config.tokenizer)
         logging.info(f"Tree successfully saved to {path}")
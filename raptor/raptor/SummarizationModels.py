@@ -1,5 +1,6 @@
 import logging
 import os
+import threading
 from abc import ABC, abstractmethod
 
 from openai import OpenAI
@@ -18,14 +19,23 @@ class GPT3TurboSummarizationModel(BaseSummarizationModel):
     def __init__(self, model="gpt-3.5-turbo"):
 
         self.model = model
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # One client per model, created on first use and shared by all threads
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = OpenAI()
+        return self._client
 
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
     def summarize(self, context, max_tokens=500, stop_sequence=None):
 
         try:
-            client = OpenAI()
-
-            response = client.chat.completions.create(
+            response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant."},
@@ -48,14 +58,23 @@ class GPT3SummarizationModel(BaseSummarizationModel):
     def __init__(self, model="text-davinci-003"):
 
         self.model = model
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # One client per model, created on first use and shared by all threads
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = OpenAI()
+        return self._client
 
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
     def summarize(self, context, max_tokens=500, stop_sequence=None):
 
         try:
-            client = OpenAI()
-
-            response = client.chat.completions.create(
+            response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant."},
@@ -1,25 +1,50 @@
 # raptor/__init__.py
-from .cluster_tree_builder import ClusterTreeBuilder, ClusterTreeConfig
-from .EmbeddingModels import (
-    BaseEmbeddingModel,
-    OpenAIEmbeddingModel,
-    SBertEmbeddingModel,
-)
-from .FaissRetriever import FaissRetriever, FaissRetrieverConfig
-from .QAModels import (
-    BaseQAModel,
-    GPT3QAModel,
-    GPT3TurboQAModel,
-    GPT4QAModel,
-    UnifiedQAModel,
-)
-from .RetrievalAugmentation import RetrievalAugmentation, RetrievalAugmentationConfig
-from .Retrievers import BaseRetriever
-from .SummarizationModels import (
-    BaseSummarizationModel,
-    GPT3SummarizationModel,
-    GPT3TurboSummarizationModel,
-)
-from .tree_builder import TreeBuilder, TreeBuilderConfig
-from .tree_retriever import TreeRetriever, TreeRetrieverConfig
-from .tree_structures import Node, Tree
+# Public names are imported on first access, so `import raptor` does not load torch,
+# transformers, sentence_transformers, umap or sklearn until a model that needs them is used.
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "ClusterTreeBuilder": ".cluster_tree_builder",
+    "ClusterTreeConfig": ".cluster_tree_builder",
+    "CachedEmbeddingModel": ".embedding_cache",
+    "EmbeddingCache": ".embedding_cache",
+    "BaseEmbeddingModel": ".EmbeddingModels",
+    "OpenAIEmbeddingModel": ".EmbeddingModels",
+    "SBertEmbeddingModel": ".EmbeddingModels",
+    "FaissRetriever": ".FaissRetriever",
+    "FaissRetrieverConfig": ".FaissRetriever",
+    "BaseQAModel": ".QAModels",
+    "GPT3QAModel": ".QAModels",
+    "GPT3TurboQAModel": ".QAModels",
+    "GPT4QAModel": ".QAModels",
+    "UnifiedQAModel": ".QAModels",
+    "RetrievalAugmentation": ".RetrievalAugmentation",
+    "RetrievalAugmentationConfig": ".RetrievalAugmentation",
+    "BaseRetriever": ".Retrievers",
+    "BaseSummarizationModel": ".SummarizationModels",
+    "GPT3SummarizationModel": ".SummarizationModels",
+    "GPT3TurboSummarizationModel": ".SummarizationModels",
+    "TreeBuilder": ".tree_builder",
+    "TreeBuilderConfig": ".tree_builder",
+    "TreeRetriever": ".tree_retriever",
+    "TreeRetrieverConfig": ".tree_retriever",
+    "load_tree": ".tree_storage",
+    "save_tree": ".tree_storage",
+    "Node": ".tree_structures",
+    "Tree": ".tree_structures",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
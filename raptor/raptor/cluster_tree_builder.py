@@ -1,10 +1,9 @@
 import logging
 import pickle
 from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
 from typing import Dict, List, Set
 
-from .cluster_utils import ClusteringAlgorithm, RAPTOR_Clustering
+from .cluster_utils import ClusteringAlgorithm, RAPTOR_Clustering, clustering_executor
 from .tree_builder import TreeBuilder, TreeBuilderConfig
 from .tree_structures import Node, Tree
 from .utils import (
@@ -25,7 +24,7 @@ class ClusterTreeConfig(TreeBuilderConfig):
         self,
         reduction_dimension=10,
         clustering_algorithm=RAPTOR_Clustering,  # Default to RAPTOR clustering
-        clustering_params={},  # Pass additional params as a dict
+        clustering_params={},  # Pass additional params as a dict, e.g. {"n_jobs": -1, "bic_patience": 5}
         *args,
         **kwargs,
     ):
@@ -63,15 +62,28 @@ class ClusterTreeBuilder(TreeBuilder):
         current_level_nodes: Dict[int, Node],
         all_tree_nodes: Dict[int, Node],
         layer_to_nodes: Dict[int, List[Node]],
-        use_multithreading: bool = False,
+        use_multithreading: bool = None,
     ) -> Dict[int, Node]:
+        """
+        Builds the summary layers on top of current_level_nodes.
+
+        Cluster summaries of a layer run concurrently on up to summarization_concurrency
+        threads (use_multithreading defaults to summarization_concurrency > 1), sharing
+        the summarization client and the rate limiter. Node indices are assigned before
+        the summaries are requested and nodes are added in index order, so the result
+        matches the serial path.
+
+        With clustering_params["n_jobs"] > 1, one process pool is created for the whole
+        build and shared by the BIC searches of every layer.
+        """
         logging.info("Using Cluster TreeBuilder")
 
+        if use_multithreading is None:
+            use_multithreading = self.summarization_concurrency > 1
+
         next_node_index = len(all_tree_nodes)
 
-        def process_cluster(
-            cluster, new_level_nodes, next_node_index, summarization_length, lock
-        ):
+        def process_cluster(cluster, node_index, summarization_length):
             node_texts = get_text(cluster)
 
             summarized_text = self.summarize(
@@ -84,74 +96,79 @@ class ClusterTreeBuilder(TreeBuilder):
             )
 
             __, new_parent_node = self.create_node(
-                next_node_index, summarized_text, {node.index for node in cluster}
+                node_index, summarized_text, {node.index for node in cluster}
             )
+            return new_parent_node
 
-            with lock:
-                new_level_nodes[next_node_index] = new_parent_node
+        clustering_params = dict(self.clustering_params)
+        clustering_pool = clustering_executor(clustering_params.get("n_jobs", 1))
+        if clustering_pool is not None:
+            clustering_params["executor"] = clustering_pool
 
-        for layer in range(self.num_layers):
+        try:
+            for layer in range(self.num_layers):
 
-            new_level_nodes = {}
+                new_level_nodes = {}
 
-            logging.info(f"Constructing Layer {layer}")
+                logging.info(f"Constructing Layer {layer}")
 
-            node_list_current_layer = get_node_list(current_level_nodes)
+                node_list_current_layer = get_node_list(current_level_nodes)
 
-            if len(node_list_current_layer) <= self.reduction_dimension + 1:
-                self.num_layers = layer
-                logging.info(
-                    f"Stopping Layer construction: Cannot Create More Layers. Total Layers in tree: {layer}"
-                )
-                break
+                if len(node_list_current_layer) <= self.reduction_dimension + 1:
+                    self.num_layers = layer
+                    logging.info(
+                        f"Stopping Layer construction: Cannot Create More Layers. Total Layers in tree: {layer}"
+                    )
+                    break
 
-            clusters = self.clustering_algorithm.perform_clustering(
-                node_list_current_layer,
-                self.cluster_embedding_model,
-                reduction_dimension=self.reduction_dimension,
-                **self.clustering_params,
-            )
+                clusters = self.clustering_algorithm.perform_clustering(
+                    node_list_current_layer,
+                    self.cluster_embedding_model,
+                    reduction_dimension=self.reduction_dimension,
+                    **clustering_params,
+                )
 
-            lock = Lock()
-
-            summarization_length = self.summarization_length
-            logging.info(f"Summarization Length: {summarization_length}")
-
-            if use_multithreading:
-                with ThreadPoolExecutor() as executor:
-                    for cluster in clusters:
-                        executor.submit(
-                            process_cluster,
-                            cluster,
-                            new_level_nodes,
-                            next_node_index,
-                            summarization_length,
-                            lock,
+                summarization_length = self.summarization_length
+                logging.info(f"Summarization Length: {summarization_length}")
+
+                node_indices = range(next_node_index, next_node_index + len(clusters))
+                next_node_index += len(clusters)
+
+                if use_multithreading:
+                    with ThreadPoolExecutor(
+                        max_workers=self.summarization_concurrency
+                    ) as executor:
+                        new_nodes = list(
+                            executor.map(
+                                process_cluster,
+                                clusters,
+                                node_indices,
+                                [summarization_length] * len(clusters),
+                            )
                         )
-                        next_node_index += 1
-                    executor.shutdown(wait=True)
-
-            else:
-                for cluster in clusters:
-                    process_cluster(
-                        cluster,
-                        new_level_nodes,
-                        next_node_index,
-                        summarization_length,
-                        lock,
-                    )
-                    next_node_index += 1
-
-            layer_to_nodes[layer + 1] = list(new_level_nodes.values())
-            current_level_nodes = new_level_nodes
-            all_tree_nodes.update(new_level_nodes)
-
-            tree = Tree(
-                all_tree_nodes,
-                layer_to_nodes[layer + 1],
-                layer_to_nodes[0],
-                layer + 1,
-                layer_to_nodes,
-            )
+
+                else:
+                    new_nodes = [
+                        process_cluster(cluster, node_index, summarization_length)
+                        for cluster, node_index in zip(clusters, node_indices)
+                    ]
+
+                for node_index, new_parent_node in zip(node_indices, new_nodes):
+                    new_level_nodes[node_index] = new_parent_node
+
+                layer_to_nodes[layer + 1] = list(new_level_nodes.values())
+                current_level_nodes = new_level_nodes
+                all_tree_nodes.update(new_level_nodes)
+
+                tree = Tree(
+                    all_tree_nodes,
+                    layer_to_nodes[layer + 1],
+                    layer_to_nodes[0],
+                    layer + 1,
+                    layer_to_nodes,
+                )
+        finally:
+            if clustering_pool is not None:
+                clustering_pool.shutdown()
 
         return current_level_nodes
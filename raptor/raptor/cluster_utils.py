@@ -1,12 +1,15 @@
 import logging
+import os
 import random
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 import numpy as np
 import tiktoken
-import umap
-from sklearn.mixture import GaussianMixture
+
+if TYPE_CHECKING:
+    from sklearn.mixture import GaussianMixture
 
 # Initialize logging
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
@@ -27,6 +30,8 @@ def global_cluster_embeddings(
     n_neighbors: Optional[int] = None,
     metric: str = "cosine",
 ) -> np.ndarray:
+    import umap
+
     if n_neighbors is None:
         n_neighbors = int((len(embeddings) - 1) ** 0.5)
     reduced_embeddings = umap.UMAP(
@@ -38,43 +43,161 @@ def global_cluster_embeddings(
 def local_cluster_embeddings(
     embeddings: np.ndarray, dim: int, num_neighbors: int = 10, metric: str = "cosine"
 ) -> np.ndarray:
+    import umap
+
     reduced_embeddings = umap.UMAP(
         n_neighbors=num_neighbors, n_components=dim, metric=metric
     ).fit_transform(embeddings)
     return reduced_embeddings
 
 
+def _fit_gaussian_mixture(
+    embeddings: np.ndarray, n_components: int, random_state: int
+) -> Tuple[float, "GaussianMixture"]:
+    from sklearn.mixture import GaussianMixture
+
+    gm = GaussianMixture(n_components=n_components, random_state=random_state)
+    gm.fit(embeddings)
+    return gm.bic(embeddings), gm
+
+
+def fit_optimal_gmm(
+    embeddings: np.ndarray,
+    max_clusters: int = 50,
+    random_state: int = RANDOM_SEED,
+    patience: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    n_jobs: int = 1,
+) -> Tuple[int, "GaussianMixture"]:
+    """
+    Searches the number of components with the lowest BIC and returns the fitted winner.
+
+    Candidates are fitted in waves of `n_jobs` on `executor`. The search stops once
+    `patience` consecutive candidates have not improved the best BIC.
+    """
+    max_clusters = min(max_clusters, len(embeddings))
+    n_clusters = list(range(1, max_clusters))
+    wave_size = max(1, n_jobs) if executor is not None else 1
+
+    best_n, best_bic, best_model = None, np.inf, None
+    since_improvement = 0
+    for start in range(0, len(n_clusters), wave_size):
+        wave = n_clusters[start : start + wave_size]
+        if executor is not None:
+            results = executor.map(
+                _fit_gaussian_mixture,
+                [embeddings] * len(wave),
+                wave,
+                [random_state] * len(wave),
+            )
+        else:
+            results = (_fit_gaussian_mixture(embeddings, n, random_state) for n in wave)
+
+        for n, (bic, gm) in zip(wave, results):
+            if bic < best_bic:
+                best_n, best_bic, best_model = n, bic, gm
+                since_improvement = 0
+            else:
+                since_improvement += 1
+
+        if patience is not None and since_improvement >= patience:
+            break
+
+    if best_model is None:
+        # Not enough points to search: fall back to a single component
+        best_n = 1
+        _, best_model = _fit_gaussian_mixture(embeddings, best_n, random_state)
+    return best_n, best_model
+
+
 def get_optimal_clusters(
-    embeddings: np.ndarray, max_clusters: int = 50, random_state: int = RANDOM_SEED
+    embeddings: np.ndarray,
+    max_clusters: int = 50,
+    random_state: int = RANDOM_SEED,
+    patience: Optional[int] = None,
 ) -> int:
-    max_clusters = min(max_clusters, len(embeddings))
-    n_clusters = np.arange(1, max_clusters)
-    bics = []
-    for n in n_clusters:
-        gm = GaussianMixture(n_components=n, random_state=random_state)
-        gm.fit(embeddings)
-        bics.append(gm.bic(embeddings))
-    optimal_clusters = n_clusters[np.argmin(bics)]
+    optimal_clusters, _ = fit_optimal_gmm(
+        embeddings, max_clusters, random_state, patience=patience
+    )
     return optimal_clusters
 
 
-def GMM_cluster(embeddings: np.ndarray, threshold: float, random_state: int = 0):
-    n_clusters = get_optimal_clusters(embeddings)
-    gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
-    gm.fit(embeddings)
+def GMM_cluster(
+    embeddings: np.ndarray,
+    threshold: float,
+    random_state: int = 0,
+    patience: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    n_jobs: int = 1,
+):
+    # The winner of the BIC search is already fitted with random_state: no refit
+    n_clusters, gm = fit_optimal_gmm(
+        embeddings,
+        random_state=random_state,
+        patience=patience,
+        executor=executor,
+        n_jobs=n_jobs,
+    )
     probs = gm.predict_proba(embeddings)
     labels = [np.where(prob > threshold)[0] for prob in probs]
     return labels, n_clusters
 
 
+def resolve_n_jobs(n_jobs: Optional[int]) -> int:
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def clustering_executor(n_jobs: Optional[int]) -> Optional[ProcessPoolExecutor]:
+    """
+    Creates the process pool for parallel BIC searches, or None when n_jobs is 1.
+
+    The pool is meant to be created once per tree build and passed to every
+    perform_clustering call; the caller shuts it down.
+    """
+    n_jobs = resolve_n_jobs(n_jobs)
+    return ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+
+
 def perform_clustering(
-    embeddings: np.ndarray, dim: int, threshold: float, verbose: bool = False
+    embeddings: np.ndarray,
+    dim: int,
+    threshold: float,
+    verbose: bool = False,
+    n_jobs: int = 1,
+    bic_patience: Optional[int] = None,
+    executor: Optional[Executor] = None,
 ) -> List[np.ndarray]:
+    n_jobs = resolve_n_jobs(n_jobs)
+    if executor is None and n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            return _perform_clustering(
+                embeddings, dim, threshold, verbose, bic_patience, executor, n_jobs
+            )
+    return _perform_clustering(
+        embeddings, dim, threshold, verbose, bic_patience, executor, n_jobs
+    )
+
+
+def _perform_clustering(
+    embeddings: np.ndarray,
+    dim: int,
+    threshold: float,
+    verbose: bool = False,
+    bic_patience: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    n_jobs: int = 1,
+) -> List[np.ndarray]:
+    gmm_params = {"patience": bic_patience, "executor": executor, "n_jobs": n_jobs}
+
     reduced_embeddings_global = global_cluster_embeddings(
         embeddings, min(dim, len(embeddings) - 2)
     )
     global_clusters, n_global_clusters = GMM_cluster(
-        reduced_embeddings_global, threshold
+        reduced_embeddings_global, threshold, **gmm_params
     )
 
     if verbose:
@@ -84,9 +207,10 @@ def perform_clustering(
     total_clusters = 0
 
     for i in range(n_global_clusters):
-        global_cluster_embeddings_ = embeddings[
-            np.array([i in gc for gc in global_clusters])
-        ]
+        # Row indices into `embeddings` are carried through both stages, so local
+        # cluster membership maps straight back to the original rows
+        global_indices = np.flatnonzero([i in gc for gc in global_clusters])
+        global_cluster_embeddings_ = embeddings[global_indices]
         if verbose:
             logging.info(
                 f"Nodes in Global Cluster {i}: {len(global_cluster_embeddings_)}"
@@ -101,19 +225,14 @@ def perform_clustering(
                 global_cluster_embeddings_, dim
             )
             local_clusters, n_local_clusters = GMM_cluster(
-                reduced_embeddings_local, threshold
+                reduced_embeddings_local, threshold, **gmm_params
             )
 
         if verbose:
             logging.info(f"Local Clusters in Global Cluster {i}: {n_local_clusters}")
 
         for j in range(n_local_clusters):
-            local_cluster_embeddings_ = global_cluster_embeddings_[
-                np.array([j in lc for lc in local_clusters])
-            ]
-            indices = np.where(
-                (embeddings == local_cluster_embeddings_[:, None]).all(-1)
-            )[1]
+            indices = global_indices[np.array([j in lc for lc in local_clusters])]
             for idx in indices:
                 all_local_clusters[idx] = np.append(
                     all_local_clusters[idx], j + total_clusters
@@ -141,22 +260,37 @@ class RAPTOR_Clustering(ClusteringAlgorithm):
         reduction_dimension: int = 10,
         threshold: float = 0.1,
         verbose: bool = False,
+        n_jobs: int = 1,
+        bic_patience: Optional[int] = None,
+        executor: Optional[Executor] = None,
     ) -> List[List[Node]]:
         # Get the embeddings from the nodes
         embeddings = np.array([node.embeddings[embedding_model_name] for node in nodes])
 
         # Perform the clustering
         clusters = perform_clustering(
-            embeddings, dim=reduction_dimension, threshold=threshold
+            embeddings,
+            dim=reduction_dimension,
+            threshold=threshold,
+            verbose=verbose,
+            n_jobs=n_jobs,
+            bic_patience=bic_patience,
+            executor=executor,
         )
 
         # Initialize an empty list to store the clusters of nodes
         node_clusters = []
 
+        # Group node indices by label in a single pass
+        label_to_indices = {}
+        for i, cluster in enumerate(clusters):
+            for label in cluster:
+                label_to_indices.setdefault(label, []).append(i)
+
         # Iterate over each unique label in the clusters
-        for label in np.unique(np.concatenate(clusters)):
+        for label in sorted(label_to_indices):
             # Get the indices of the nodes that belong to this cluster
-            indices = [i for i, cluster in enumerate(clusters) if label in cluster]
+            indices = label_to_indices[label]
 
             # Add the corresponding nodes to the node_clusters list
             cluster_nodes = [nodes[i] for i in indices]
@@ -179,7 +313,12 @@ class RAPTOR_Clustering(ClusteringAlgorithm):
                     )
                 node_clusters.extend(
                     RAPTOR_Clustering.perform_clustering(
-                        cluster_nodes, embedding_model_name, max_length_in_cluster
+                        cluster_nodes,
+                        embedding_model_name,
+                        max_length_in_cluster,
+                        n_jobs=n_jobs,
+                        bic_patience=bic_patience,
+                        executor=executor,
                     )
                 )
             else:
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .EmbeddingModels import BaseEmbeddingModel
+
+logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing: Unicode NFC and collapsed whitespace.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    A disk-backed embedding cache keyed by (model name, normalized text hash).
+
+    Vectors are stored as raw float32 blobs in SQLite. The least recently used
+    entries are evicted once the cache holds more than `max_entries` vectors.
+    The same cache file can be shared by RAPTOR embedding models and the FAISS store.
+    """
+
+    def __init__(
+        self, path: str = "db/embedding_cache.sqlite", max_entries: int = 200000
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "accessed_at REAL NOT NULL, PRIMARY KEY (model, hash))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed_at "
+                "ON embeddings (accessed_at)"
+            )
+
+    def get_many(
+        self, model_name: str, texts: Sequence[str]
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Looks up the embeddings of several texts.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            texts (Sequence[str]): The texts to look up.
+
+        Returns:
+            List[Optional[np.ndarray]]: A float32 vector for every cached text, None for the others.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique_hashes), _SQL_BATCH):
+                batch = unique_hashes[start : start + _SQL_BATCH]
+                rows = self._connection.execute(
+                    "SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN "
+                    f"({','.join('?' * len(batch))})",
+                    (model_name, *batch),
+                ).fetchall()
+                for hash_, vector in rows:
+                    found[hash_] = np.frombuffer(vector, dtype=np.float32)
+            if found:
+                with self._connection:
+                    self._connection.executemany(
+                        "UPDATE embeddings SET accessed_at = ? WHERE model = ? AND hash = ?",
+                        [(now, model_name, hash_) for hash_ in found],
+                    )
+            results = [found.get(hash_) for hash_ in hashes]
+            n_hits = sum(result is not None for result in results)
+            self.hits += n_hits
+            self.misses += len(results) - n_hits
+        return results
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors) -> None:
+        """
+        Stores the embeddings of several texts and evicts the least recently used entries.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            texts (Sequence[str]): The embedded texts.
+            vectors: The embeddings, one per text.
+        """
+        now = time.time()
+        rows = [
+            (
+                model_name,
+                text_hash(text),
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if self.max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN ("
+                    "SELECT rowid FROM embeddings ORDER BY accessed_at DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns hit and miss counters, the hit rate and the number of cached vectors.
+        """
+        with self._lock:
+            size = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+    def embed(
+        self, model_name: str, texts: Sequence[str], embed_fn
+    ) -> List[np.ndarray]:
+        """
+        Returns embeddings for texts, computing only the missing ones with embed_fn.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            texts (Sequence[str]): The texts to embed.
+            embed_fn: A function that embeds a list of texts in one call.
+
+        Returns:
+            List[np.ndarray]: One float32 vector per text, in input order.
+        """
+        texts = list(texts)
+        results = self.get_many(model_name, texts)
+
+        # Texts with the same normalized hash are embedded once
+        missing: Dict[str, List[int]] = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(text_hash(texts[i]), []).append(i)
+        if missing:
+            missing_texts = [texts[indices[0]] for indices in missing.values()]
+            vectors = embed_fn(missing_texts)
+            self.put_many(model_name, missing_texts, vectors)
+            for indices, vector in zip(missing.values(), vectors):
+                for i in indices:
+                    results[i] = np.asarray(vector, dtype=np.float32)
+        return results
+
+
+class CachedEmbeddingModel(BaseEmbeddingModel):
+    """
+    Wraps any BaseEmbeddingModel so its embeddings are read from and written to an EmbeddingCache.
+    """
+
+    def __init__(
+        self,
+        model: BaseEmbeddingModel,
+        cache: EmbeddingCache,
+        model_name: Optional[str] = None,
+    ):
+        if not isinstance(model, BaseEmbeddingModel):
+            raise ValueError("model must be an instance of BaseEmbeddingModel")
+        self.model = model
+        self.cache = cache
+        self.model_name = model_name or _default_model_name(model)
+
+    def create_embedding(self, text):
+        return self.create_embeddings([text])[0]
+
+    def create_embeddings(self, texts):
+        return self.cache.embed(self.model_name, texts, self.model.create_embeddings)
+
+
+def _default_model_name(model: BaseEmbeddingModel) -> str:
+    name = getattr(model, "model_name", None) or getattr(model, "model", None)
+    if not isinstance(name, str):
+        name = type(model).__name__
+    return f"{type(model).__name__}:{name}"
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that refills continuously at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute: float) -> None:
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.available = min(
+            self.capacity,
+            self.available + (now - self.updated_at) * self.rate_per_second,
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Requests larger than the bucket are let through once it is full
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate_per_second
+
+    def consume(self, amount: float) -> None:
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Limits requests per minute and tokens per minute across threads.
+
+    Either budget can be None to leave it unlimited.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> None:
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> None:
+        """
+        Blocks until one request using `tokens` tokens fits into both budgets.
+
+        Args:
+            tokens (int): The estimated number of tokens (prompt and completion) of the request.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = 0.0
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    if self.requests is not None:
+                        self.requests.consume(1)
+                    if self.tokens is not None:
+                        self.tokens.consume(tokens)
+                    return
+            time.sleep(wait)
@@ -6,12 +6,15 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
 from typing import Dict, List, Optional, Set, Tuple
 
+import numpy as np
 import openai
 import tiktoken
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
+from .embedding_cache import CachedEmbeddingModel
 from .EmbeddingModels import BaseEmbeddingModel, OpenAIEmbeddingModel
 from .SummarizationModels import BaseSummarizationModel, GPT3TurboSummarizationModel
+from .rate_limiter import RateLimiter
 from .tree_structures import Node, Tree
 from .utils import (
     distances_from_embeddings,
@@ -20,6 +23,8 @@ from .utils import (
     get_node_list,
     get_text,
     indices_of_nearest_neighbors_from_distances,
+    normalize_embeddings,
+    pairwise_distances_from_embeddings,
     split_text,
 )
 
@@ -39,6 +44,10 @@ class TreeBuilderConfig:
         summarization_model=None,
         embedding_models=None,
         cluster_embedding_model=None,
+        summarization_concurrency=None,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        embedding_cache=None,
     ):
         if tokenizer is None:
             tokenizer = tiktoken.get_encoding("cl100k_base")
@@ -97,6 +106,11 @@ class TreeBuilderConfig:
                 raise ValueError(
                     "All embedding models must be an instance of BaseEmbeddingModel"
                 )
+        if embedding_cache is not None:
+            embedding_models = {
+                model_name: CachedEmbeddingModel(model, embedding_cache)
+                for model_name, model in embedding_models.items()
+            }
         self.embedding_models = embedding_models
 
         if cluster_embedding_model is None:
@@ -107,6 +121,28 @@ class TreeBuilderConfig:
             )
         self.cluster_embedding_model = cluster_embedding_model
 
+        if summarization_concurrency is None:
+            summarization_concurrency = 8
+        if (
+            not isinstance(summarization_concurrency, int)
+            or summarization_concurrency < 1
+        ):
+            raise ValueError(
+                "summarization_concurrency must be an integer and at least 1"
+            )
+        self.summarization_concurrency = summarization_concurrency
+
+        for name, value in (
+            ("requests_per_minute", requests_per_minute),
+            ("tokens_per_minute", tokens_per_minute),
+        ):
+            if value is not None and (
+                not isinstance(value, (int, float)) or value <= 0
+            ):
+                raise ValueError(f"{name} must be a positive number or None")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
     def log_config(self):
         config_log = """
         TreeBuilderConfig:
@@ -120,6 +156,9 @@ class TreeBuilderConfig:
             Summarization Model: {summarization_model}
             Embedding Models: {embedding_models}
             Cluster Embedding Model: {cluster_embedding_model}
+            Summarization Concurrency: {summarization_concurrency}
+            Requests Per Minute: {requests_per_minute}
+            Tokens Per Minute: {tokens_per_minute}
         """.format(
             tokenizer=self.tokenizer,
             max_tokens=self.max_tokens,
@@ -131,6 +170,9 @@ class TreeBuilderConfig:
             summarization_model=self.summarization_model,
             embedding_models=self.embedding_models,
             cluster_embedding_model=self.cluster_embedding_model,
+            summarization_concurrency=self.summarization_concurrency,
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
         )
         return config_log
 
@@ -155,6 +197,10 @@ class TreeBuilder:
         self.summarization_model = config.summarization_model
         self.embedding_models = config.embedding_models
         self.cluster_embedding_model = config.cluster_embedding_model
+        self.summarization_concurrency = config.summarization_concurrency
+        self.rate_limiter = RateLimiter(
+            config.requests_per_minute, config.tokens_per_minute
+        )
 
         logging.info(
             f"Successfully initialized TreeBuilder with Config {config.log_config()}"
@@ -201,6 +247,9 @@ class TreeBuilder:
         """
         Generates a summary of the input context using the specified summarization model.
 
+        The call waits for the builder's rate limiter, so concurrent summaries stay within
+        the configured requests-per-minute and tokens-per-minute budgets.
+
         Args:
             context (str, optional): The context to summarize.
             max_tokens (int, optional): The maximum number of tokens in the generated summary. Defaults to 150.o
@@ -208,6 +257,7 @@ class TreeBuilder:
         Returns:
             str: The generated summary.
         """
+        self.rate_limiter.acquire(len(self.tokenizer.encode(context)) + max_tokens)
         return self.summarization_model.summarize(context, max_tokens)
 
     def get_relevant_nodes(self, current_node, list_nodes) -> List[Node]:
@@ -226,48 +276,79 @@ class TreeBuilder:
         distances = distances_from_embeddings(
             current_node.embeddings[self.cluster_embedding_model], embeddings
         )
-        indices = indices_of_nearest_neighbors_from_distances(distances)
-
         if self.selection_mode == "threshold":
+            indices = indices_of_nearest_neighbors_from_distances(distances)
             best_indices = [
                 index for index in indices if distances[index] > self.threshold
             ]
 
         elif self.selection_mode == "top_k":
-            best_indices = indices[: self.top_k]
+            best_indices = indices_of_nearest_neighbors_from_distances(
+                distances, self.top_k
+            )
 
         nodes_to_add = [list_nodes[idx] for idx in best_indices]
 
         return nodes_to_add
 
-    def multithreaded_create_leaf_nodes(self, chunks: List[str]) -> Dict[int, Node]:
-        """Creates leaf nodes using multithreading from the given list of text chunks.
+    def create_leaf_nodes(
+        self, chunks: List[str], use_multithreading: bool = True
+    ) -> Dict[int, Node]:
+        """Creates leaf nodes from the given list of text chunks.
+
+        Every embedding model embeds all chunks with one create_embeddings call, which
+        batches them into as few requests as the model allows.
 
         Args:
             chunks (List[str]): A list of text chunks to be turned into leaf nodes.
+            use_multithreading (bool): Whether to run the embedding models concurrently.
 
         Returns:
             Dict[int, Node]: A dictionary mapping node indices to the corresponding leaf nodes.
         """
-        with ThreadPoolExecutor() as executor:
-            future_nodes = {
-                executor.submit(self.create_node, index, text): (index, text)
-                for index, text in enumerate(chunks)
+        if use_multithreading and len(self.embedding_models) > 1:
+            with ThreadPoolExecutor(max_workers=len(self.embedding_models)) as executor:
+                futures = {
+                    model_name: executor.submit(model.create_embeddings, chunks)
+                    for model_name, model in self.embedding_models.items()
+                }
+                model_embeddings = {
+                    model_name: future.result()
+                    for model_name, future in futures.items()
+                }
+        else:
+            model_embeddings = {
+                model_name: model.create_embeddings(chunks)
+                for model_name, model in self.embedding_models.items()
             }
 
-            leaf_nodes = {}
-            for future in as_completed(future_nodes):
-                index, node = future.result()
-                leaf_nodes[index] = node
+        leaf_nodes = {}
+        for index, text in enumerate(chunks):
+            embeddings = {
+                model_name: embeddings[index]
+                for model_name, embeddings in model_embeddings.items()
+            }
+            leaf_nodes[index] = Node(text, index, set(), embeddings)
 
         return leaf_nodes
 
+    def multithreaded_create_leaf_nodes(self, chunks: List[str]) -> Dict[int, Node]:
+        """Creates leaf nodes from the given list of text chunks, running the embedding models concurrently.
+
+        Args:
+            chunks (List[str]): A list of text chunks to be turned into leaf nodes.
+
+        Returns:
+            Dict[int, Node]: A dictionary mapping node indices to the corresponding leaf nodes.
+        """
+        return self.create_leaf_nodes(chunks, use_multithreading=True)
+
     def build_from_text(self, text: str, use_multithreading: bool = True) -> Tree:
         """Builds a golden tree from the input text, optionally using multithreading.
 
         Args:
             text (str): The input text.
-            use_multithreading (bool, optional): Whether to use multithreading when creating leaf nodes.
+            use_multithreading (bool, optional): Whether to run the embedding models concurrently when creating leaf nodes.
                 Default: True.
 
         Returns:
@@ -277,28 +358,188 @@ class TreeBuilder:
 
         logging.info("Creating Leaf Nodes")
 
-        if use_multithreading:
-            leaf_nodes = self.multithreaded_create_leaf_nodes(chunks)
-        else:
-            leaf_nodes = {}
-            for index, text in enumerate(chunks):
-                __, node = self.create_node(index, text)
-                leaf_nodes[index] = node
-
-        layer_to_nodes = {0: list(leaf_nodes.values())}
+        leaf_nodes = self.create_leaf_nodes(chunks, use_multithreading)
 
         logging.info(f"Created {len(leaf_nodes)} Leaf Embeddings")
 
+        return self.build_from_leaf_nodes(leaf_nodes)
+
+    def build_from_leaf_nodes(self, leaf_nodes: Dict[int, Node]) -> Tree:
+        """Builds a tree on top of already embedded leaf nodes.
+
+        Args:
+            leaf_nodes (Dict[int, Node]): The leaf nodes, indexed from 0.
+
+        Returns:
+            Tree: The golden tree structure.
+        """
+        layer_to_nodes = {0: list(leaf_nodes.values())}
+
         logging.info("Building All Nodes")
 
         all_nodes = copy.deepcopy(leaf_nodes)
 
+        # construct_tree lowers num_layers when it runs out of nodes to cluster,
+        # which must not cap later builds
+        configured_num_layers = self.num_layers
         root_nodes = self.construct_tree(all_nodes, all_nodes, layer_to_nodes)
 
         tree = Tree(all_nodes, root_nodes, leaf_nodes, self.num_layers, layer_to_nodes)
+        self.num_layers = configured_num_layers
+
+        return tree
+
+    def add_to_tree(
+        self,
+        tree: Tree,
+        text: str,
+        rebuild_drift_threshold: Optional[float] = 0.3,
+        force_rebuild: bool = False,
+    ) -> Tree:
+        """Adds text to an existing tree without rebuilding it.
+
+        Only the new chunks are embedded. Each new leaf is attached to the layer 1 node
+        whose children centroid is nearest in the cluster embedding space, and only the
+        ancestors of the new leaves are re-summarized and re-embedded, keeping their
+        indices. Once the share of incrementally inserted leaves exceeds
+        rebuild_drift_threshold, the tree is rebuilt from all leaves instead, reusing
+        their embeddings.
+
+        Args:
+            tree (Tree): The tree to extend. It is updated in place unless it is rebuilt.
+            text (str): The text to add.
+            rebuild_drift_threshold (Optional[float]): The share of inserted leaves that
+                triggers a full rebuild. None never rebuilds. Defaults to 0.3.
+            force_rebuild (bool): Whether to rebuild the tree regardless of drift.
+
+        Returns:
+            Tree: The updated tree.
+        """
+        chunks = split_text(text, self.tokenizer, self.max_tokens)
+        if not chunks and not force_rebuild:
+            return tree
+
+        next_index = max(tree.all_nodes) + 1 if tree.all_nodes else 0
+        new_leaves = []
+        if chunks:
+            new_leaves = [
+                Node(node.text, next_index + i, set(), node.embeddings)
+                for i, node in enumerate(self.create_leaf_nodes(chunks).values())
+            ]
+            logging.info(f"Created {len(new_leaves)} Leaf Embeddings")
+
+        leaf_nodes = get_node_list(tree.leaf_nodes) + new_leaves
+        if not leaf_nodes:
+            return tree
+        num_inserted_leaves = getattr(tree, "num_inserted_leaves", 0) + len(new_leaves)
+        drift = num_inserted_leaves / len(leaf_nodes)
+        if force_rebuild or (
+            rebuild_drift_threshold is not None and drift > rebuild_drift_threshold
+        ):
+            logging.info(
+                f"Rebuilding tree from {len(leaf_nodes)} leaves (drift {drift:.2f})"
+            )
+            return self.build_from_leaf_nodes(
+                {
+                    i: Node(node.text, i, set(), node.embeddings)
+                    for i, node in enumerate(leaf_nodes)
+                }
+            )
+
+        for node in new_leaves:
+            tree.all_nodes[node.index] = node
+            tree.layer_to_nodes.setdefault(0, []).append(node)
+            if isinstance(tree.leaf_nodes, dict):
+                tree.leaf_nodes[node.index] = node
+            else:
+                tree.leaf_nodes.append(node)
+        tree.num_inserted_leaves = num_inserted_leaves
+
+        if tree.num_layers == 0 or not tree.layer_to_nodes.get(1):
+            # A tree without summary layers keeps its leaves as roots
+            for node in new_leaves:
+                if isinstance(tree.root_nodes, dict):
+                    tree.root_nodes[node.index] = node
+                else:
+                    tree.root_nodes.append(node)
+        else:
+            self._attach_to_parents(tree, new_leaves)
+            self._resummarize_ancestors(tree, {node.index for node in new_leaves})
+
+        # Matrices loaded from disk no longer match the nodes
+        tree.embedding_matrices = None
+        tree.embedding_matrix_indices = None
+        tree.normalized_embedding_matrices = None
+        tree.token_counts = None
 
         return tree
 
+    def _attach_to_parents(self, tree: Tree, new_leaves: List[Node]) -> None:
+        parents = tree.layer_to_nodes[1]
+        centroids = np.asarray(
+            [
+                (
+                    normalize_embeddings(
+                        [
+                            tree.all_nodes[child].embeddings[
+                                self.cluster_embedding_model
+                            ]
+                            for child in sorted(parent.children)
+                        ]
+                    ).mean(axis=0)
+                    if parent.children
+                    else parent.embeddings[self.cluster_embedding_model]
+                )
+                for parent in parents
+            ],
+            dtype=np.float32,
+        )
+        distances = pairwise_distances_from_embeddings(
+            [node.embeddings[self.cluster_embedding_model] for node in new_leaves],
+            centroids,
+        )
+        for node, row in zip(new_leaves, distances.argmin(axis=1).tolist()):
+            parents[row].children.add(node.index)
+
+    def _resummarize_ancestors(self, tree: Tree, changed: Set[int]) -> None:
+        for layer in range(1, tree.num_layers + 1):
+            dirty = [
+                node
+                for node in tree.layer_to_nodes.get(layer, [])
+                if node.children & changed
+            ]
+            if not dirty:
+                return
+
+            logging.info(f"Re-summarizing {len(dirty)} nodes in Layer {layer}")
+
+            def summarize_node(node):
+                children = [tree.all_nodes[child] for child in sorted(node.children)]
+                return self.summarize(
+                    context=get_text(children), max_tokens=self.summarization_length
+                )
+
+            if self.summarization_concurrency > 1:
+                with ThreadPoolExecutor(
+                    max_workers=self.summarization_concurrency
+                ) as executor:
+                    summaries = list(executor.map(summarize_node, dirty))
+            else:
+                summaries = [summarize_node(node) for node in dirty]
+
+            model_embeddings = {
+                model_name: model.create_embeddings(summaries)
+                for model_name, model in self.embedding_models.items()
+            }
+            # Nodes are updated in place, so every layer, root and index map stays consistent
+            for i, (node, summary) in enumerate(zip(dirty, summaries)):
+                node.text = summary
+                node.embeddings = {
+                    model_name: embeddings[i]
+                    for model_name, embeddings in model_embeddings.items()
+                }
+            changed = {node.index for node in dirty}
+
     @abstractclassmethod
     def construct_tree(
         self,
@@ -1,7 +1,8 @@
 import logging
 import os
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 
+import numpy as np
 import tiktoken
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
@@ -15,6 +16,7 @@ from .utils import (
     get_node_list,
     get_text,
     indices_of_nearest_neighbors_from_distances,
+    normalize_embeddings,
     reverse_mapping,
 )
 
@@ -144,6 +146,8 @@ class TreeRetriever(BaseRetriever):
 
         self.tree_node_index_to_layer = reverse_mapping(self.tree.layer_to_nodes)
 
+        self._build_embedding_index()
+
         logging.info(
             f"Successfully initialized TreeRetriever with Config {config.log_config()}"
         )
@@ -160,57 +164,96 @@ class TreeRetriever(BaseRetriever):
         """
         return self.embedding_model.create_embedding(text)
 
-    def retrieve_information_collapse_tree(
-        self, query: str, top_k: int, max_tokens: int
-    ) -> str:
+    def _build_embedding_index(self) -> None:
         """
-        Retrieves the most relevant information from the tree based on the query.
-
-        Args:
-            query (str): The query text.
-            max_tokens (int): The maximum number of tokens.
-
-        Returns:
-            str: The context created using the most relevant nodes.
+        Precomputes everything a query needs from the tree: a contiguous float32 matrix
+        of unit-normalized node embeddings (in sorted node index order), the row of
+        every node, the rows of every layer and the token count of every node.
         """
+        self.node_list = get_node_list(self.tree.all_nodes)
+        self.node_index_to_row = {
+            node.index: row for row, node in enumerate(self.node_list)
+        }
+
+        # Trees loaded from disk carry (memory-mapped) normalized matrices and token
+        # counts in sorted node order. They are used as loaded, without a copy, while
+        # their rows still match the tree's nodes
+        matrix_indices = getattr(self.tree, "embedding_matrix_indices", None)
+        stored = matrix_indices is not None and np.array_equal(
+            matrix_indices, [node.index for node in self.node_list]
+        )
+        normalized_matrices = (
+            getattr(self.tree, "normalized_embedding_matrices", None) or {}
+        )
+        matrices = getattr(self.tree, "embedding_matrices", None) or {}
+        if stored and self.context_embedding_model in normalized_matrices:
+            self.embedding_matrix = normalized_matrices[self.context_embedding_model]
+        elif stored and self.context_embedding_model in matrices:
+            self.embedding_matrix = normalize_embeddings(
+                matrices[self.context_embedding_model]
+            )
+        else:
+            self.embedding_matrix = normalize_embeddings(
+                get_embeddings(self.node_list, self.context_embedding_model)
+            )
 
-        query_embedding = self.create_embedding(query)
-
-        selected_nodes = []
-
-        node_list = get_node_list(self.tree.all_nodes)
+        self.layer_rows = {
+            layer: np.array(
+                sorted(self.node_index_to_row[node.index] for node in nodes),
+                dtype=np.intp,
+            )
+            for layer, nodes in self.tree.layer_to_nodes.items()
+        }
+        self.layer_matrices = {
+            layer: self._rows_matrix(rows) for layer, rows in self.layer_rows.items()
+        }
+        token_counts = getattr(self.tree, "token_counts", None) or {}
+        tokenizer_name = getattr(self.tokenizer, "name", None)
+        if stored and tokenizer_name in token_counts:
+            self.node_token_counts = token_counts[tokenizer_name]
+        else:
+            self.node_token_counts = np.array(
+                [len(self.tokenizer.encode(node.text)) for node in self.node_list],
+                dtype=np.int64,
+            )
 
-        embeddings = get_embeddings(node_list, self.context_embedding_model)
+    def _rows_matrix(self, rows: np.ndarray) -> np.ndarray:
+        # Layers usually occupy a contiguous range of node indices: use a view, not a copy
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            return self.embedding_matrix[rows[0] : rows[-1] + 1]
+        return self.embedding_matrix[rows]
 
-        distances = distances_from_embeddings(query_embedding, embeddings)
+    def _distances(self, query_embedding, matrix: np.ndarray) -> np.ndarray:
+        """
+        Cosine distances between a query and unit-normalized rows, as one matrix-vector product.
+        """
+        return 1.0 - matrix @ normalize_embeddings(query_embedding)[0]
 
-        indices = indices_of_nearest_neighbors_from_distances(distances)
+    def _select_collapse_tree(self, rows: np.ndarray, max_tokens: int) -> List[Node]:
+        selected_nodes = []
 
         total_tokens = 0
-        for idx in indices[:top_k]:
+        for row in rows:
 
-            node = node_list[idx]
-            node_tokens = len(self.tokenizer.encode(node.text))
+            node_tokens = self.node_token_counts[row]
 
             if total_tokens + node_tokens > max_tokens:
                 break
 
-            selected_nodes.append(node)
+            selected_nodes.append(self.node_list[row])
             total_tokens += node_tokens
 
-        context = get_text(selected_nodes)
-        return selected_nodes, context
+        return selected_nodes
 
-    def retrieve_information(
-        self, current_nodes: List[Node], query: str, num_layers: int
+    def retrieve_information_collapse_tree(
+        self, query: str, top_k: int, max_tokens: int
     ) -> str:
         """
         Retrieves the most relevant information from the tree based on the query.
 
         Args:
-            current_nodes (List[Node]): A List of the current nodes.
             query (str): The query text.
-            num_layers (int): The number of layers to traverse.
+            max_tokens (int): The maximum number of tokens.
 
         Returns:
             str: The context created using the most relevant nodes.
@@ -218,27 +261,50 @@ class TreeRetriever(BaseRetriever):
 
         query_embedding = self.create_embedding(query)
 
-        selected_nodes = []
+        distances = self._distances(query_embedding, self.embedding_matrix)
 
-        node_list = current_nodes
+        rows = indices_of_nearest_neighbors_from_distances(distances, top_k)
 
-        for layer in range(num_layers):
+        selected_nodes = self._select_collapse_tree(rows, max_tokens)
 
-            embeddings = get_embeddings(node_list, self.context_embedding_model)
+        context = get_text(selected_nodes)
+        return selected_nodes, context
 
-            distances = distances_from_embeddings(query_embedding, embeddings)
+    def _select_layers(
+        self,
+        current_nodes: List[Node],
+        query_embedding,
+        num_layers: int,
+        start_layer: int = None,
+    ) -> List[Node]:
+        selected_nodes = []
+
+        if start_layer is not None:
+            rows = self.layer_rows[start_layer]
+            matrix = self.layer_matrices[start_layer]
+        else:
+            rows = np.array(
+                [self.node_index_to_row[node.index] for node in current_nodes],
+                dtype=np.intp,
+            )
+            matrix = self.embedding_matrix[rows]
+
+        for layer in range(num_layers):
 
-            indices = indices_of_nearest_neighbors_from_distances(distances)
+            distances = self._distances(query_embedding, matrix)
 
             if self.selection_mode == "threshold":
+                indices = indices_of_nearest_neighbors_from_distances(distances)
                 best_indices = [
                     index for index in indices if distances[index] > self.threshold
                 ]
 
             elif self.selection_mode == "top_k":
-                best_indices = indices[: self.top_k]
+                best_indices = indices_of_nearest_neighbors_from_distances(
+                    distances, self.top_k
+                )
 
-            nodes_to_add = [node_list[idx] for idx in best_indices]
+            nodes_to_add = [self.node_list[rows[idx]] for idx in best_indices]
 
             selected_nodes.extend(nodes_to_add)
 
@@ -246,43 +312,51 @@ class TreeRetriever(BaseRetriever):
 
                 child_nodes = []
 
-                for index in best_indices:
-                    child_nodes.extend(node_list[index].children)
+                for node in nodes_to_add:
+                    child_nodes.extend(node.children)
 
                 # take the unique values
                 child_nodes = list(dict.fromkeys(child_nodes))
-                node_list = [self.tree.all_nodes[i] for i in child_nodes]
+                rows = np.array(
+                    [self.node_index_to_row[i] for i in child_nodes], dtype=np.intp
+                )
+                matrix = self.embedding_matrix[rows]
 
-        context = get_text(selected_nodes)
-        return selected_nodes, context
+        return selected_nodes
 
-    def retrieve(
+    def retrieve_information(
         self,
+        current_nodes: List[Node],
         query: str,
+        num_layers: int,
         start_layer: int = None,
-        num_layers: int = None,
-        top_k: int = 10,
-        max_tokens: int = 3500,
-        collapse_tree: bool = True,
-        return_layer_information: bool = False,
     ) -> str:
         """
-        Queries the tree and returns the most relevant information.
+        Retrieves the most relevant information from the tree based on the query.
 
         Args:
+            current_nodes (List[Node]): A List of the current nodes.
             query (str): The query text.
-            start_layer (int): The layer to start from. Defaults to self.start_layer.
-            num_layers (int): The number of layers to traverse. Defaults to self.num_layers.
-            max_tokens (int): The maximum number of tokens. Defaults to 3500.
-            collapse_tree (bool): Whether to retrieve information from all nodes. Defaults to False.
+            num_layers (int): The number of layers to traverse.
+            start_layer (int, optional): The layer current_nodes belong to, if they are a whole
+                layer. Its precomputed matrix is then used directly.
 
         Returns:
-            str: The result of the query.
+            str: The context created using the most relevant nodes.
         """
 
-        if not isinstance(query, str):
-            raise ValueError("query must be a string")
+        query_embedding = self.create_embedding(query)
 
+        selected_nodes = self._select_layers(
+            current_nodes, query_embedding, num_layers, start_layer
+        )
+
+        context = get_text(selected_nodes)
+        return selected_nodes, context
+
+    def _resolve_layers(
+        self, start_layer: int, num_layers: int, max_tokens: int, collapse_tree: bool
+    ) -> Tuple[int, int]:
         if not isinstance(max_tokens, int) or max_tokens < 1:
             raise ValueError("max_tokens must be an integer and at least 1")
 
@@ -306,16 +380,10 @@ class TreeRetriever(BaseRetriever):
         if num_layers > (start_layer + 1):
             raise ValueError("num_layers must be less than or equal to start_layer + 1")
 
-        if collapse_tree:
-            logging.info(f"Using collapsed_tree")
-            selected_nodes, context = self.retrieve_information_collapse_tree(
-                query, top_k, max_tokens
-            )
-        else:
-            layer_nodes = self.tree.layer_to_nodes[start_layer]
-            selected_nodes, context = self.retrieve_information(
-                layer_nodes, query, num_layers
-            )
+        return start_layer, num_layers
+
+    def _format_result(self, selected_nodes: List[Node], return_layer_information):
+        context = get_text(selected_nodes)
 
         if return_layer_information:
 
@@ -332,3 +400,113 @@ class TreeRetriever(BaseRetriever):
             return context, layer_information
 
         return context
+
+    def retrieve(
+        self,
+        query: str,
+        start_layer: int = None,
+        num_layers: int = None,
+        top_k: int = 10,
+        max_tokens: int = 3500,
+        collapse_tree: bool = True,
+        return_layer_information: bool = False,
+    ) -> str:
+        """
+        Queries the tree and returns the most relevant information.
+
+        Args:
+            query (str): The query text.
+            start_layer (int): The layer to start from. Defaults to self.start_layer.
+            num_layers (int): The number of layers to traverse. Defaults to self.num_layers.
+            max_tokens (int): The maximum number of tokens. Defaults to 3500.
+            collapse_tree (bool): Whether to retrieve information from all nodes. Defaults to False.
+
+        Returns:
+            str: The result of the query.
+        """
+
+        if not isinstance(query, str):
+            raise ValueError("query must be a string")
+
+        start_layer, num_layers = self._resolve_layers(
+            start_layer, num_layers, max_tokens, collapse_tree
+        )
+
+        if collapse_tree:
+            logging.info(f"Using collapsed_tree")
+            selected_nodes, context = self.retrieve_information_collapse_tree(
+                query, top_k, max_tokens
+            )
+        else:
+            layer_nodes = self.tree.layer_to_nodes[start_layer]
+            selected_nodes, context = self.retrieve_information(
+                layer_nodes, query, num_layers, start_layer
+            )
+
+        return self._format_result(selected_nodes, return_layer_information)
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        start_layer: int = None,
+        num_layers: int = None,
+        top_k: int = 10,
+        max_tokens: int = 3500,
+        collapse_tree: bool = True,
+        return_layer_information: bool = False,
+    ) -> List:
+        """
+        Queries the tree with several queries at once.
+
+        All queries are embedded with one embedding model call and scored against the
+        node matrix with one matrix product. Token budgeting (collapse_tree) or layer
+        traversal then runs per query.
+
+        Args:
+            queries (List[str]): The query texts.
+            start_layer (int): The layer to start from. Defaults to self.start_layer.
+            num_layers (int): The number of layers to traverse. Defaults to self.num_layers.
+            max_tokens (int): The maximum number of tokens per query. Defaults to 3500.
+            collapse_tree (bool): Whether to retrieve information from all nodes. Defaults to True.
+
+        Returns:
+            List: The result of retrieve for every query, in input order.
+        """
+
+        if not isinstance(queries, (list, tuple)) or not all(
+            isinstance(query, str) for query in queries
+        ):
+            raise ValueError("queries must be a list of strings")
+
+        start_layer, num_layers = self._resolve_layers(
+            start_layer, num_layers, max_tokens, collapse_tree
+        )
+
+        if not queries:
+            return []
+
+        query_embeddings = normalize_embeddings(
+            self.embedding_model.create_embeddings(list(queries))
+        )
+
+        if collapse_tree:
+            logging.info(f"Using collapsed_tree for {len(queries)} queries")
+            distances = 1.0 - query_embeddings @ self.embedding_matrix.T
+            rows = indices_of_nearest_neighbors_from_distances(distances, top_k)
+            selected = [
+                self._select_collapse_tree(query_rows, max_tokens)
+                for query_rows in rows
+            ]
+        else:
+            layer_nodes = self.tree.layer_to_nodes[start_layer]
+            selected = [
+                self._select_layers(
+                    layer_nodes, query_embedding, num_layers, start_layer
+                )
+                for query_embedding in query_embeddings
+            ]
+
+        return [
+            self._format_result(selected_nodes, return_layer_information)
+            for selected_nodes in selected
+        ]
@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import shutil
+from typing import Dict
+
+import numpy as np
+
+from .tree_structures import Node, Tree
+from .utils import get_node_list, normalize_embeddings, reverse_mapping
+
+logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+
+def _offsets(lengths) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _node_indices(nodes) -> np.ndarray:
+    # root_nodes / leaf_nodes are dicts keyed by index, or lists of nodes
+    indices = (
+        nodes.keys() if isinstance(nodes, dict) else [node.index for node in nodes]
+    )
+    return np.array(sorted(indices), dtype=np.int64)
+
+
+def is_tree_directory(path: str) -> bool:
+    """
+    Checks whether the path is a tree saved with save_tree.
+    """
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def save_tree(tree: Tree, path: str, tokenizer=None) -> None:
+    """
+    Saves a tree as a directory of columnar files.
+
+    Nodes are stored in ascending index order. Each embedding model gets a float32
+    .npy matrix plus a unit-normalized copy (the same file when the embeddings are
+    already unit length), texts are one UTF-8 blob with an offset array, and children
+    and layers are flat integer arrays. With a named tokenizer (e.g. a tiktoken
+    encoding) the token count of every node is stored too, so the retriever needs
+    neither to normalize nor to tokenize at startup. The directory is written next
+    to the target and renamed into place, so readers never see a partially written tree.
+
+    Args:
+        tree (Tree): The tree to save.
+        path (str): The target directory.
+        tokenizer: The retriever's tokenizer used for the stored token counts. Optional.
+    """
+    node_list = get_node_list(tree.all_nodes)
+    node_to_layer = reverse_mapping(tree.layer_to_nodes)
+    model_names = sorted(node_list[0].embeddings.keys()) if node_list else []
+
+    tmp_path = f"{path.rstrip(os.sep)}.tmp"
+    _remove(tmp_path)
+    os.makedirs(tmp_path)
+
+    embedding_files = {}
+    normalized_embedding_files = {}
+    for i, model_name in enumerate(model_names):
+        embedding_files[model_name] = f"embeddings_{i}.npy"
+        matrix = np.asarray(
+            [node.embeddings[model_name] for node in node_list], dtype=np.float32
+        )
+        np.save(os.path.join(tmp_path, embedding_files[model_name]), matrix)
+        normalized = normalize_embeddings(matrix)
+        if normalized is matrix:
+            normalized_embedding_files[model_name] = embedding_files[model_name]
+        else:
+            normalized_embedding_files[model_name] = f"normalized_embeddings_{i}.npy"
+            np.save(
+                os.path.join(tmp_path, normalized_embedding_files[model_name]),
+                normalized,
+            )
+
+    tokenizer_name = getattr(tokenizer, "name", None)
+    if tokenizer_name is not None:
+        np.save(
+            os.path.join(tmp_path, "token_counts.npy"),
+            np.array(
+                [len(tokenizer.encode(node.text)) for node in node_list],
+                dtype=np.int64,
+            ),
+        )
+
+    encoded_texts = [node.text.encode("utf-8") for node in node_list]
+    with open(os.path.join(tmp_path, "texts.bin"), "wb") as file:
+        for encoded in encoded_texts:
+            file.write(encoded)
+    np.save(
+        os.path.join(tmp_path, "text_offsets.npy"),
+        _offsets([len(encoded) for encoded in encoded_texts]),
+    )
+
+    children = [sorted(node.children) for node in node_list]
+    np.save(
+        os.path.join(tmp_path, "children.npy"),
+        np.fromiter(
+            (child for node_children in children for child in node_children),
+            dtype=np.int64,
+        ),
+    )
+    np.save(
+        os.path.join(tmp_path, "children_offsets.npy"),
+        _offsets([len(node_children) for node_children in children]),
+    )
+
+    np.save(
+        os.path.join(tmp_path, "indices.npy"),
+        np.array([node.index for node in node_list], dtype=np.int64),
+    )
+    np.save(
+        os.path.join(tmp_path, "layers.npy"),
+        np.array(
+            [node_to_layer.get(node.index, -1) for node in node_list], dtype=np.int32
+        ),
+    )
+    np.save(
+        os.path.join(tmp_path, "root_indices.npy"),
+        _node_indices(tree.root_nodes),
+    )
+    np.save(
+        os.path.join(tmp_path, "leaf_indices.npy"),
+        _node_indices(tree.leaf_nodes),
+    )
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "num_nodes": len(node_list),
+        "num_layers": tree.num_layers,
+        "layers": sorted(tree.layer_to_nodes.keys()),
+        "embedding_files": embedding_files,
+        "normalized_embedding_files": normalized_embedding_files,
+        "token_counts_tokenizer": tokenizer_name,
+        "num_inserted_leaves": getattr(tree, "num_inserted_leaves", 0),
+    }
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as file:
+        json.dump(meta, file, indent=2)
+
+    # A previous tree (directory or legacy pickle file) is moved aside, then removed
+    old_path = f"{path.rstrip(os.sep)}.old"
+    _remove(old_path)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    _remove(old_path)
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def load_tree(path: str, mmap: bool = True) -> Tree:
+    """
+    Loads a tree saved with save_tree.
+
+    Embedding matrices are opened with np.load(mmap_mode="r") by default, so they
+    are paged in on demand and shared through the page cache between processes
+    that load the same tree. Node embeddings are row views into these matrices,
+    which are also exposed as tree.embedding_matrices for the retriever, together
+    with the node index of every row as tree.embedding_matrix_indices. The
+    normalized matrices and the token counts saved with the tree are exposed as
+    tree.normalized_embedding_matrices and tree.token_counts (keyed by tokenizer name).
+
+    Only the embeddings are lazy: one Node per row is still built and its text
+    decoded, so loading stays linear in the number of nodes.
+
+    Args:
+        path (str): The tree directory.
+        mmap (bool): Whether to memory-map the embedding matrices. Defaults to True.
+
+    Returns:
+        Tree: The loaded tree.
+    """
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as file:
+        meta = json.load(file)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported tree format version {meta.get('format_version')} in {path}"
+        )
+
+    def load(name, mmap_mode=None):
+        return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+
+    files: Dict[str, np.ndarray] = {}
+
+    def load_matrix(file_name):
+        # A model whose embeddings are unit length shares one file for both matrices
+        if file_name not in files:
+            files[file_name] = load(file_name, "r" if mmap else None)
+        return files[file_name]
+
+    matrices = {
+        model_name: load_matrix(file_name)
+        for model_name, file_name in meta["embedding_files"].items()
+    }
+    # Trees saved before normalized matrices and token counts were stored have neither
+    normalized_matrices = {
+        model_name: load_matrix(file_name)
+        for model_name, file_name in meta.get("normalized_embedding_files", {}).items()
+    }
+    token_counts = {}
+    if meta.get("token_counts_tokenizer") is not None:
+        token_counts[meta["token_counts_tokenizer"]] = load("token_counts.npy")
+
+    indices = load("indices.npy")
+    layers = load("layers.npy")
+    text_offsets = load("text_offsets.npy")
+    children = load("children.npy")
+    children_offsets = load("children_offsets.npy")
+    with open(os.path.join(path, "texts.bin"), "rb") as file:
+        texts = file.read()
+
+    all_nodes = {}
+    for row, index in enumerate(indices.tolist()):
+        text = texts[text_offsets[row] : text_offsets[row + 1]].decode("utf-8")
+        node_children = set(
+            children[children_offsets[row] : children_offsets[row + 1]].tolist()
+        )
+        embeddings = {
+            model_name: matrix[row] for model_name, matrix in matrices.items()
+        }
+        all_nodes[index] = Node(text, index, node_children, embeddings)
+
+    layer_to_nodes = {layer: [] for layer in meta["layers"]}
+    for index, layer in zip(indices.tolist(), layers.tolist()):
+        if layer >= 0:
+            layer_to_nodes.setdefault(layer, []).append(all_nodes[index])
+
+    root_nodes = {
+        index: all_nodes[index] for index in load("root_indices.npy").tolist()
+    }
+    leaf_nodes = {
+        index: all_nodes[index] for index in load("leaf_indices.npy").tolist()
+    }
+
+    tree = Tree(
+        all_nodes,
+        root_nodes,
+        leaf_nodes,
+        meta["num_layers"],
+        layer_to_nodes,
+        meta.get("num_inserted_leaves", 0),
+    )
+    tree.embedding_matrices = matrices
+    tree.embedding_matrix_indices = indices
+    tree.normalized_embedding_matrices = normalized_matrices
+    tree.token_counts = token_counts
+
+    logging.info(f"Loaded tree with {len(all_nodes)} nodes from {path}")
+    return tree
@@ -19,10 +19,18 @@ class Tree:
     """
 
     def __init__(
-        self, all_nodes, root_nodes, leaf_nodes, num_layers, layer_to_nodes
+        self,
+        all_nodes,
+        root_nodes,
+        leaf_nodes,
+        num_layers,
+        layer_to_nodes,
+        num_inserted_leaves: int = 0,
     ) -> None:
         self.all_nodes = all_nodes
         self.root_nodes = root_nodes
         self.leaf_nodes = leaf_nodes
         self.num_layers = num_layers
         self.layer_to_nodes = layer_to_nodes
+        # Leaves added incrementally since the last full build
+        self.num_inserted_leaves = num_inserted_leaves
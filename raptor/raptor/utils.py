@@ -1,10 +1,9 @@
 import logging
 import re
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
 import numpy as np
 import tiktoken
-from scipy import spatial
 
 from .tree_structures import Node
 
@@ -21,7 +20,7 @@ def reverse_mapping(layer_to_nodes: Dict[int, List[Node]]) -> Dict[Node, int]:
 
 def split_text(
     text: str,
-    tokenizer: tiktoken.get_encoding("cl100k_base"),
+    tokenizer: tiktoken.Encoding,
     max_tokens: int,
     overlap: int = 0,
 ):
@@ -116,40 +115,97 @@ def split_text(
     return chunks
 
 
-def distances_from_embeddings(
-    query_embedding: List[float],
-    embeddings: List[List[float]],
+DISTANCE_METRICS = ("cosine", "L1", "L2", "Linf")
+
+
+def _as_matrix(embeddings) -> np.ndarray:
+    return np.ascontiguousarray(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+
+
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """
+    Returns the embeddings as a contiguous float32 matrix with unit-length rows.
+
+    Args:
+        embeddings (array-like): A single embedding or a (num_embeddings x dim) matrix.
+
+    Returns:
+        np.ndarray: The normalized (num_embeddings x dim) matrix. Zero rows stay zero.
+            A float32 matrix whose rows are already unit length is returned without a copy.
+    """
+    matrix = _as_matrix(embeddings)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    if np.allclose(norms, 1.0, atol=1e-4):
+        return matrix
+    return matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def pairwise_distances_from_embeddings(
+    query_embeddings,
+    embeddings,
     distance_metric: str = "cosine",
-) -> List[float]:
+) -> np.ndarray:
     """
-    Calculates the distances between a query embedding and a list of embeddings.
+    Calculates the distances between several query embeddings and a matrix of embeddings.
 
     Args:
-        query_embedding (List[float]): The query embedding.
-        embeddings (List[List[float]]): A list of embeddings to compare against the query embedding.
+        query_embeddings (array-like): A (num_queries x dim) matrix of query embeddings.
+        embeddings (array-like): A (num_embeddings x dim) matrix of embeddings to compare against.
         distance_metric (str, optional): The distance metric to use for calculation. Defaults to 'cosine'.
 
     Returns:
-        List[float]: The calculated distances between the query embedding and the list of embeddings.
+        np.ndarray: A (num_queries x num_embeddings) float32 matrix of distances.
     """
-    distance_metrics = {
-        "cosine": spatial.distance.cosine,
-        "L1": spatial.distance.cityblock,
-        "L2": spatial.distance.euclidean,
-        "Linf": spatial.distance.chebyshev,
-    }
-
-    if distance_metric not in distance_metrics:
+    if distance_metric not in DISTANCE_METRICS:
         raise ValueError(
-            f"Unsupported distance metric '{distance_metric}'. Supported metrics are: {list(distance_metrics.keys())}"
+            f"Unsupported distance metric '{distance_metric}'. Supported metrics are: {list(DISTANCE_METRICS)}"
         )
 
-    distances = [
-        distance_metrics[distance_metric](query_embedding, embedding)
-        for embedding in embeddings
-    ]
+    queries = _as_matrix(query_embeddings)
+    matrix = _as_matrix(embeddings)
+    if matrix.size == 0:
+        return np.empty((len(queries), 0), dtype=np.float32)
+
+    if distance_metric == "cosine":
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        matrix_norms = np.linalg.norm(matrix, axis=1)
+        similarities = queries @ matrix.T
+        similarities /= np.maximum(
+            query_norms * matrix_norms, np.finfo(np.float32).tiny
+        )
+        return 1.0 - similarities
+
+    if distance_metric == "L2":
+        squared = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            - 2.0 * (queries @ matrix.T)
+            + np.einsum("ij,ij->i", matrix, matrix)[None, :]
+        )
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    reduce = np.sum if distance_metric == "L1" else np.max
+    return np.stack([reduce(np.abs(matrix - query), axis=1) for query in queries])
+
+
+def distances_from_embeddings(
+    query_embedding,
+    embeddings,
+    distance_metric: str = "cosine",
+) -> np.ndarray:
+    """
+    Calculates the distances between a query embedding and a matrix of embeddings.
 
-    return distances
+    Args:
+        query_embedding (array-like): The query embedding.
+        embeddings (array-like): A (num_embeddings x dim) matrix of embeddings to compare against the query embedding.
+        distance_metric (str, optional): The distance metric to use for calculation. Defaults to 'cosine'.
+
+    Returns:
+        np.ndarray: The calculated distances between the query embedding and the embeddings.
+    """
+    return pairwise_distances_from_embeddings(
+        query_embedding, embeddings, distance_metric
+    )[0]
 
 
 def get_node_list(node_dict: Dict[int, Node]) -> List[Node]:
@@ -211,14 +267,28 @@ def get_text(node_list: List[Node]) -> str:
     return text
 
 
-def indices_of_nearest_neighbors_from_distances(distances: List[float]) -> np.ndarray:
+def indices_of_nearest_neighbors_from_distances(
+    distances, top_k: Optional[int] = None
+) -> np.ndarray:
     """
     Returns the indices of nearest neighbors sorted in ascending order of distance.
 
     Args:
-        distances (List[float]): A list of distances between embeddings.
+        distances (array-like): A vector of distances, or a (num_queries x num_embeddings) matrix.
+        top_k (int, optional): Only return the top_k nearest neighbors. They are selected with
+            argpartition and only those are sorted. Defaults to None (all neighbors).
 
     Returns:
-        np.ndarray: An array of indices sorted by ascending distance.
+        np.ndarray: An array of indices sorted by ascending distance, one row per query for a matrix.
     """
-    return np.argsort(distances)
+    distances = np.asarray(distances)
+    num_embeddings = distances.shape[-1]
+    if top_k is None or top_k >= num_embeddings:
+        return np.argsort(distances, axis=-1, kind="stable")
+    if top_k < 1:
+        return np.empty(distances.shape[:-1] + (0,), dtype=np.intp)
+
+    candidates = np.argpartition(distances, top_k - 1, axis=-1)[..., :top_k]
+    candidate_distances = np.take_along_axis(distances, candidates, axis=-1)
+    order = np.argsort(candidate_distances, axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
@@ -0,0 +1,179 @@
+import inspect
+import json
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class ResourceRegistry:
+    def __init__(self) -> None:
+        """
+        Общий для процесса реестр тяжелых объектов: моделей эмбеддингов, реранкера,
+        клиентов LLM и загруженных индексов.
+
+        Объект создается при первом запросе и затем переиспользуется всеми, кто
+        запрашивает его с той же конфигурацией. Разные объекты могут загружаться
+        параллельно, один и тот же - только один раз.
+        """
+        self._resources: Dict[Tuple[str, Hashable], Any] = {}
+        self._locks: Dict[Tuple[str, Hashable], Lock] = {}
+        self._lock = Lock()
+
+    def get(self, kind: str, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Возвращает объект вида kind с конфигурацией key, создавая его через factory при первом обращении.
+
+        :param kind: Вид объекта, например "embeddings".
+        :param key: Хэшируемый ключ конфигурации, см. config_key.
+        :param factory: Функция без аргументов, создающая объект.
+        :return: Общий экземпляр объекта.
+        """
+        resource_key = (kind, key)
+        with self._lock:
+            if resource_key in self._resources:
+                return self._resources[resource_key]
+            lock = self._locks.setdefault(resource_key, Lock())
+        with lock:
+            if resource_key not in self._resources:
+                resource = factory()
+                with self._lock:
+                    self._resources[resource_key] = resource
+        return self._resources[resource_key]
+
+    def put(self, kind: str, key: Hashable, resource: Any) -> None:
+        """
+        Заменяет объект вида kind с конфигурацией key, например после обновления индекса.
+        """
+        with self._lock:
+            self._resources[(kind, key)] = resource
+
+    def discard(self, kind: str, key: Hashable) -> None:
+        """
+        Забывает объект вида kind с конфигурацией key, например освобожденный снимок индекса.
+        """
+        with self._lock:
+            self._resources.pop((kind, key), None)
+            self._locks.pop((kind, key), None)
+
+    def keys(self) -> List[Tuple[str, Hashable]]:
+        with self._lock:
+            return list(self._resources)
+
+    def clear(self, kind: Optional[str] = None) -> None:
+        """
+        Забывает созданные объекты (все или только вида kind). Уже выданные ссылки остаются рабочими.
+        """
+        with self._lock:
+            for resource_key in list(self._resources):
+                if kind is None or resource_key[0] == kind:
+                    del self._resources[resource_key]
+                    self._locks.pop(resource_key, None)
+
+
+_registry = ResourceRegistry()
+
+
+def get_registry() -> ResourceRegistry:
+    return _registry
+
+
+def config_key(**config: Any) -> str:
+    """
+    Строит ключ реестра из параметров конфигурации как канонический JSON.
+    """
+    return json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _constructor_key(cls, config: Dict[str, Any]) -> str:
+    # Параметры по умолчанию подставляются явно, чтобы CertRAG(index_type="flat")
+    # и вызов без index_type получали один и тот же объект
+    arguments = inspect.signature(cls).bind(**config)
+    arguments.apply_defaults()
+    return config_key(**arguments.arguments)
+
+
+def get_embedding_cache(path: str):
+    from raptor.raptor.embedding_cache import EmbeddingCache
+
+    return _registry.get(
+        "embedding_cache", config_key(path=path), lambda: EmbeddingCache(path)
+    )
+
+
+def get_embeddings(model_name_or_path: str, embedding_cache_path: Optional[str]):
+    """
+    Возвращает общую модель эмбеддингов HuggingFace, обернутую кэшем эмбеддингов.
+
+    :param model_name_or_path: Имя или путь модели sentence-transformers.
+    :param embedding_cache_path: Путь к кэшу эмбеддингов, None - без кэша.
+    """
+
+    def create():
+        # Импорт тянет за собой sentence_transformers и torch, поэтому выполняется по требованию
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        from store import CachedEmbeddings
+
+        embeddings = _registry.get(
+            "huggingface_embeddings",
+            config_key(model=model_name_or_path),
+            lambda: HuggingFaceEmbeddings(model_name=model_name_or_path),
+        )
+        if embedding_cache_path is None:
+            return embeddings
+        return CachedEmbeddings(
+            embeddings,
+            get_embedding_cache(embedding_cache_path),
+            f"HuggingFace:{model_name_or_path}",
+        )
+
+    return _registry.get(
+        "embeddings",
+        config_key(model=model_name_or_path, cache=embedding_cache_path),
+        create,
+    )
+
+
+def get_cross_encoder(model_name: str):
+    def create():
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder(model_name)
+
+    return _registry.get("cross_encoder", config_key(model=model_name), create)
+
+
+def get_llm(**config: Any):
+    """
+    Возвращает общий LLMModel с заданными параметрами конструктора.
+    """
+    from llm import LLMModel
+
+    return _registry.get(
+        "llm", _constructor_key(LLMModel, config), lambda: LLMModel(**config)
+    )
+
+
+def get_vector_store(**config: Any):
+    """
+    Возвращает общий FAISSVectorStore с заданными параметрами конструктора.
+    """
+    from store import FAISSVectorStore
+
+    return _registry.get(
+        "vector_store",
+        _constructor_key(FAISSVectorStore, config),
+        lambda: FAISSVectorStore(**config),
+    )
+
+
+def get_sharded_store(**config: Any):
+    """
+    Возвращает общий ShardedVectorStore с заданными параметрами конструктора.
+    """
+    from sharded_store import ShardedVectorStore
+
+    return _registry.get(
+        "sharded_store",
+        _constructor_key(ShardedVectorStore, config),
+        lambda: ShardedVectorStore(**config),
+    )
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str = "db/llm_cache.sqlite",
+        namespace: str = "",
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 30 * 24 * 3600,
+        evict_every: int = 100,
+    ) -> None:
+        """
+        Дисковый кэш ответов языковой модели на SQLite.
+
+        Записи адресуются парой (namespace, хэш содержимого запроса), поэтому несколько
+        конфигураций модели и шаблона могут делить один файл. Записи конфигураций,
+        которые больше не используются, вытесняются по сроку жизни и давности использования.
+
+        :param path: Путь к файлу базы данных.
+        :param namespace: Отпечаток модели и шаблона, к которому относятся записи.
+        :param max_entries: Максимальное число записей, лишние вытесняются по давности использования.
+        :param ttl_seconds: Время жизни записи в секундах, None - без ограничения.
+        :param evict_every: Вытеснение запускается раз в столько записей, поэтому кэш
+            может временно превышать max_entries на это число записей.
+        """
+        if evict_every < 1:
+            raise ValueError("evict_every must be positive")
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = evict_every
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            # Кэши старого формата с ключом только по хэшу запроса пересоздаются
+            namespace_pk = self._connection.execute(
+                "SELECT pk FROM pragma_table_info('responses') WHERE name = 'namespace'"
+            ).fetchone()
+            if namespace_pk is not None and namespace_pk[0] == 0:
+                self._connection.execute("DROP TABLE responses")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+        self.evict()
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        """
+        Строит ключ записи как SHA-256 от канонического JSON частей запроса.
+        """
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Возвращает сохраненный ответ или None, если записи нет или она устарела.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM responses WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Сохраняет ответ. Каждые evict_every записей вытесняет старые записи.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Удаляет записи с истекшим сроком жизни и самые давно использованные сверх max_entries.
+        """
+        with self._lock, self._connection:
+            if self.ttl_seconds is not None:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - self.ttl_seconds,),
+                )
+            self._connection.execute(
+                "DELETE FROM responses WHERE rowid IN ("
+                "SELECT rowid FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        """
+        Удаляет записи своего namespace, не трогая записи других конфигураций.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM responses WHERE namespace = ?", (self.namespace,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает счетчики попаданий и промахов и текущий размер кэша.
+        """
+        with self._lock:
+            size = self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
@@ -0,0 +1,372 @@
+import os
+import re
+import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from llm import RegulationObject
+from lexical import reciprocal_rank_fusion
+from store import LEXICAL_INDEX_DIR, FAISSVectorStore, embed_queries
+from utils import load_documents_from_directory
+
+# Ключевые слова и сокращения, по которым требование относится к объекту регулирования
+REGULATION_KEYWORDS = {
+    RegulationObject.BRAKING: [
+        r"brak",
+        r"\babs\b",
+        r"anti-lock",
+        r"\br\s?13(-h)?\b",
+        r"тормоз",
+    ],
+    RegulationObject.AVAS: [
+        r"\bavas\b",
+        r"acoustic",
+        r"alerting",
+        r"\bsound",
+        r"db\s?\(a\)",
+        r"pedestrian",
+        r"\br\s?138\b",
+        r"звук",
+        r"акустич",
+    ],
+    RegulationObject.WIPE_AND_WASH: [
+        r"wipe",
+        r"wiping",
+        r"washer",
+        r"windscreen",
+        r"windshield",
+        r"стеклоочист",
+        r"омыват",
+    ],
+    RegulationObject.HVAC: [
+        r"\bhvac\b",
+        r"heating",
+        r"ventilat",
+        r"air.conditioning",
+        r"defrost",
+        r"demist",
+        r"отоплен",
+        r"вентиляц",
+        r"обогрев",
+    ],
+    RegulationObject.BRAKE_ASSIST: [
+        r"brake assist",
+        r"\bbas\b",
+        r"emergency braking",
+        r"\br\s?139\b",
+        r"экстренн\w* торможен",
+    ],
+}
+
+
+def shard_name(regulation_object: RegulationObject) -> str:
+    return regulation_object.value.replace(" ", "_")
+
+
+def shard_for_source(source: str) -> str:
+    """
+    Определяет шард документа по имени файла: объект регулирования, если имя
+    начинается с него (например, Brake_assist_EN_Specifications.txt), иначе имя файла.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    name = stem.replace("_", " ").lower()
+    for regulation_object in sorted(
+        RegulationObject, key=lambda obj: len(obj.value), reverse=True
+    ):
+        if name.startswith(regulation_object.value.lower()):
+            return shard_name(regulation_object)
+    return stem
+
+
+class RegulationRouter:
+    def __init__(self, similarity_margin: float = 0.05, min_shards: int = 1):
+        """
+        Выбирает шарды для запроса по ключевым словам и близости к центроидам шардов.
+
+        :param similarity_margin: Шарды, чья косинусная близость к запросу отстает от лучшей
+            не больше чем на это значение, тоже выбираются.
+        :param min_shards: Сколько ближайших по центроиду шардов выбирается всегда.
+        """
+        self.similarity_margin = similarity_margin
+        self.min_shards = min_shards
+        self.patterns = {
+            shard_name(regulation_object): [
+                re.compile(pattern, re.IGNORECASE) for pattern in patterns
+            ]
+            for regulation_object, patterns in REGULATION_KEYWORDS.items()
+        }
+
+    def keyword_shards(self, query: str, shard_names):
+        return {
+            name
+            for name in shard_names
+            if any(pattern.search(query) for pattern in self.patterns.get(name, []))
+        }
+
+    def route(self, queries, query_vectors, shard_names, centroids):
+        """
+        Маршрутизирует пачку запросов.
+
+        :param queries: Тексты запросов.
+        :param query_vectors: Эмбеддинги запросов.
+        :param shard_names: Имена шардов.
+        :param centroids: Матрица нормированных центроидов шардов в том же порядке.
+        :return: Для каждого запроса множество имен выбранных шардов.
+        """
+        vectors = np.asarray(query_vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(
+            np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+        )
+        similarities = vectors @ np.asarray(centroids, dtype=np.float32).T
+
+        routes = []
+        for query, row in zip(queries, similarities):
+            selected = self.keyword_shards(query, shard_names)
+            order = np.argsort(-row)
+            selected.update(shard_names[i] for i in order[: self.min_shards])
+            best = row[order[0]]
+            selected.update(
+                shard_names[i] for i in order if row[i] >= best - self.similarity_margin
+            )
+            routes.append(selected)
+        return routes
+
+
+class ShardedVectorStore:
+    def __init__(
+        self,
+        model_name_or_path="sentence-transformers/all-MiniLM-L6-v2",
+        shards_path="db/faiss_shards",
+        documents_path="RegDocs",
+        embedding_cache_path="db/embedding_cache.sqlite",
+        index_type="flat",
+        index_params=None,
+        router=None,
+        fan_out=False,
+        max_workers=None,
+        watch=False,
+        poll_interval=5.0,
+        lexical=False,
+    ):
+        """
+        Набор FAISS индексов, по одному на объект регулирования или исходный документ.
+
+        Запрос ищется только в шардах, которые выбрал роутер, либо во всех шардах
+        параллельно при fan_out. Результаты шардов объединяются по score.
+
+        :param shards_path: Каталог, в котором каждый шард хранится в своем подкаталоге.
+        :param router: RegulationRouter, по умолчанию создается с настройками по умолчанию.
+        :param fan_out: Искать ли всегда во всех шардах.
+        :param max_workers: Число потоков для параллельного поиска по шардам.
+        :param watch: Подключать ли новые снимки шардов на лету, см. FAISSVectorStore.
+        :param lexical: Загружать ли BM25 индексы шардов для search_hybrid_batch.
+        """
+        self.shards_path = shards_path
+        self.documents_path = documents_path
+        self.shard_config = {
+            "model_name_or_path": model_name_or_path,
+            "documents_path": documents_path,
+            "embedding_cache_path": embedding_cache_path,
+            "index_type": index_type,
+            "index_params": index_params,
+            "watch": watch,
+            "poll_interval": poll_interval,
+            "lexical": lexical,
+        }
+        self.router = router or RegulationRouter()
+        self.fan_out = fan_out
+        self.max_workers = max_workers
+
+        names = (
+            sorted(
+                name
+                for name in os.listdir(shards_path)
+                # Общий каталог bm25 мог остаться от прежней раскладки, это не шард
+                if name != LEXICAL_INDEX_DIR
+                and os.path.isdir(os.path.join(shards_path, name))
+            )
+            if os.path.isdir(shards_path)
+            else []
+        )
+        if names:
+            groups = {name: None for name in names}
+        else:
+            documents = load_documents_from_directory(documents_path)
+            if not documents:
+                raise FileNotFoundError(
+                    "No FAISS shards found and no documents available to create them."
+                )
+            groups = self._group_documents(documents)
+
+        self.shards = {}
+        for name, shard_documents in groups.items():
+            self.shards[name] = self._create_shard(name, shard_documents)
+
+        # Модель эмбеддингов общая для всех шардов через реестр
+        self.embeddings = self.shards[next(iter(self.shards))].embeddings
+        self._refresh_shards()
+
+    def _group_documents(self, documents):
+        groups = defaultdict(list)
+        for doc in documents:
+            groups[shard_for_source(doc["metadata"]["source"])].append(doc)
+        return dict(sorted(groups.items()))
+
+    def _create_shard(self, name, documents=None):
+        return FAISSVectorStore(
+            index_path=os.path.join(self.shards_path, name),
+            documents=documents,
+            **self.shard_config,
+        )
+
+    def _refresh_shards(self):
+        self.shard_names = sorted(self.shards)
+
+    @property
+    def centroids(self):
+        return self._centroids(self.shards, self.shard_names)
+
+    @staticmethod
+    def _centroids(shards, shard_names):
+        # Центроиды читаются из текущих снимков шардов, поэтому подмена снимка сразу учитывается
+        return np.stack([shards[name].centroid for name in shard_names])
+
+    @property
+    def version(self):
+        return tuple(self.shards[name].version for name in self.shard_names)
+
+    def update(self, documents=None):
+        """
+        Инкрементально обновляет шарды по изменившимся файлам (см. FAISSVectorStore.update).
+
+        Для документов нового объекта регулирования создается новый шард, шарды
+        без документов удаляются.
+
+        :param documents: Текущие документы. По умолчанию читаются из documents_path.
+        :return: Сводки обновления по именам шардов.
+        """
+        if documents is None:
+            documents = load_documents_from_directory(self.documents_path)
+        groups = self._group_documents(documents)
+
+        summaries = {}
+        for name in list(self.shards):
+            if name in groups:
+                summaries[name] = self.shards[name].update(groups[name])
+            else:
+                self.shards.pop(name).close()
+                shutil.rmtree(os.path.join(self.shards_path, name))
+                summaries[name] = "removed"
+        for name, shard_documents in groups.items():
+            if name not in self.shards:
+                self.shards[name] = self._create_shard(name, shard_documents)
+                summaries[name] = "created"
+        self._refresh_shards()
+        return summaries
+
+    def segment_texts(self):
+        return [
+            text
+            for name in self.shard_names
+            for text in self.shards[name].segment_texts()
+        ]
+
+    def search_similar(self, query, k=2, nprobe=None, ef_search=None, fan_out=None):
+        return self.search_similar_batch([query], k, nprobe, ef_search, fan_out)[0]
+
+    def search_similar_batch(
+        self, queries, k=2, nprobe=None, ef_search=None, fan_out=None
+    ):
+        """
+        Ищет сегменты для пачки запросов в выбранных роутером шардах.
+
+        Запросы эмбеддятся один раз, каждый шард ищет сразу все направленные в него
+        запросы, шарды опрашиваются параллельно. Для каждого запроса берутся k лучших
+        сегментов по score (расстоянию) среди всех его шардов.
+
+        :param queries: Тексты запросов.
+        :param k: Количество сегментов на запрос.
+        :param nprobe: Число просматриваемых IVF кластеров.
+        :param ef_search: Размер списка кандидатов HNSW.
+        :param fan_out: Искать во всех шардах. По умолчанию значение из конструктора.
+        :return: Список пар (сегмент, score) для каждого запроса, в порядке запросов.
+        """
+        return self._search_batch(queries, k, nprobe, ef_search, fan_out, False)[0]
+
+    def search_hybrid_batch(
+        self, queries, k=2, nprobe=None, ef_search=None, fan_out=None
+    ):
+        """
+        Ищет сегменты для пачки запросов в FAISS и BM25 выбранных роутером шардов.
+
+        FAISS и BM25 каждого шарда читаются из одного его снимка. BM25 score шардов
+        несравнимы (у каждого свои IDF и средняя длина), поэтому списки шардов
+        объединяются по рангам методом reciprocal rank fusion, см. search_similar_batch.
+
+        :return: Пара списков для каждого запроса: (сегмент, расстояние) из FAISS
+            и (сегмент, BM25 score в своем шарде) в порядке слияния.
+        """
+        return self._search_batch(queries, k, nprobe, ef_search, fan_out, True)
+
+    def _search_batch(self, queries, k, nprobe, ef_search, fan_out, lexical):
+        if not queries:
+            return [], []
+        if fan_out is None:
+            fan_out = self.fan_out
+
+        queries = list(queries)
+        vectors = np.asarray(embed_queries(self.embeddings, queries), dtype=np.float32)
+        # Набор шардов фиксируется на весь запрос, даже если update добавит или удалит шард
+        shards = dict(self.shards)
+        shard_names = sorted(shards)
+        if fan_out:
+            routes = [set(shard_names) for _ in queries]
+        else:
+            routes = self.router.route(
+                queries, vectors, shard_names, self._centroids(shards, shard_names)
+            )
+
+        rows_by_shard = defaultdict(list)
+        for row, names in enumerate(routes):
+            for name in names:
+                rows_by_shard[name].append(row)
+
+        def search_shard(name):
+            rows = rows_by_shard[name]
+            if lexical:
+                results, lexical_results = shards[name].search_hybrid_vectors(
+                    vectors[rows], [queries[row] for row in rows], k, nprobe, ef_search
+                )
+            else:
+                results = shards[name].search_vectors(
+                    vectors[rows], k, nprobe, ef_search
+                )
+                lexical_results = None
+            return rows, results, lexical_results
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers or len(rows_by_shard)
+        ) as executor:
+            shard_results = list(executor.map(search_shard, list(rows_by_shard)))
+
+        merged = [[] for _ in queries]
+        lexical_lists = [[] for _ in queries]
+        for rows, results, lexical_results in shard_results:
+            for row, result in zip(rows, results):
+                merged[row].extend(result)
+            for row, result in zip(rows, lexical_results or []):
+                lexical_lists[row].append(result)
+        return (
+            [sorted(result, key=lambda x: x[1])[:k] for result in merged],
+            [self._fuse_lexical(results, k) for results in lexical_lists],
+        )
+
+    @staticmethod
+    def _fuse_lexical(results, k):
+        scores = {segment: score for result in results for segment, score in result}
+        fused = reciprocal_rank_fusion(
+            [[segment for segment, _ in result] for result in results], limit=k
+        )
+        return [(segment, scores[segment]) for segment in fused]
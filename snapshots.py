@@ -0,0 +1,208 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+# Сколько последних снимков хранится на диске для процессов, которые еще их загружают
+KEEP_SNAPSHOTS = 3
+
+
+def publish_directory(staging_path, path):
+    """
+    Подменяет каталог path полностью подготовленным каталогом staging_path.
+
+    Читатели видят либо старую, либо новую версию целиком: старый каталог
+    сначала переименовывается и удаляется только после подмены.
+    """
+    old_path = f"{path.rstrip(os.sep)}.old"
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(staging_path, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def snapshot_name(version):
+    return f"v{version:06d}"
+
+
+def current_snapshot_path(root):
+    """
+    Каталог текущего снимка индекса по указателю CURRENT.
+
+    Индексы старого формата без указателя считаются единственным снимком в самом root.
+    """
+    pointer_path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(pointer_path):
+        return root
+    with open(pointer_path, "r", encoding="utf-8") as file:
+        return os.path.join(root, SNAPSHOTS_DIR, file.read().strip())
+
+
+def publish_snapshot(root, staging_path, version, keep=KEEP_SNAPSHOTS):
+    """
+    Публикует подготовленный каталог staging_path как снимок версии version.
+
+    Снимок переносится в root/snapshots/vNNNNNN, после чего указатель CURRENT
+    атомарно переключается на него. Старые снимки сверх keep удаляются; процессы,
+    уже загрузившие их в память, продолжают работать.
+
+    :return: Каталог опубликованного снимка.
+    """
+    if os.path.exists(os.path.join(root, "index.faiss")):
+        # Индекс старого формата целиком заменяется каталогом со снимками
+        migrated_root = f"{root.rstrip(os.sep)}.snapshots"
+        if os.path.exists(migrated_root):
+            shutil.rmtree(migrated_root)
+        os.makedirs(os.path.join(migrated_root, SNAPSHOTS_DIR))
+        os.replace(
+            staging_path,
+            os.path.join(migrated_root, SNAPSHOTS_DIR, snapshot_name(version)),
+        )
+        with open(
+            os.path.join(migrated_root, CURRENT_FILE), "w", encoding="utf-8"
+        ) as file:
+            file.write(snapshot_name(version))
+        publish_directory(migrated_root, root)
+        return current_snapshot_path(root)
+
+    snapshots_path = os.path.join(root, SNAPSHOTS_DIR)
+    os.makedirs(snapshots_path, exist_ok=True)
+    snapshot_path = os.path.join(snapshots_path, snapshot_name(version))
+    if os.path.exists(snapshot_path):
+        shutil.rmtree(snapshot_path)
+    os.replace(staging_path, snapshot_path)
+
+    pointer_path = os.path.join(root, CURRENT_FILE)
+    with open(f"{pointer_path}.tmp", "w", encoding="utf-8") as file:
+        file.write(snapshot_name(version))
+    os.replace(f"{pointer_path}.tmp", pointer_path)
+
+    for name in sorted(os.listdir(snapshots_path))[:-keep]:
+        if name != snapshot_name(version):
+            shutil.rmtree(os.path.join(snapshots_path, name), ignore_errors=True)
+    return snapshot_path
+
+
+class _Handle:
+    def __init__(self, path, resource):
+        self.path = path
+        self.resource = resource
+        self.refs = 0
+        self.retired = False
+
+
+class SnapshotManager:
+    def __init__(self, root, load, release=None, poll_interval=5.0):
+        """
+        Держит загруженный текущий снимок индекса и подменяет его на новый без остановки сервера.
+
+        Запрос захватывает снимок через acquire и работает с ним до конца, даже если
+        в это время был опубликован и подменен новый. Новый снимок загружается в
+        фоне, подмена происходит атомарно между запросами. Старый снимок
+        освобождается, когда его отпускает последний запрос.
+
+        :param root: Каталог индекса с указателем CURRENT.
+        :param load: Функция, загружающая снимок по пути его каталога.
+        :param release: Функция (путь, снимок), вызываемая при освобождении старого снимка.
+        :param poll_interval: Период проверки указателя CURRENT в секундах при watch.
+        """
+        self.root = root
+        self.load = load
+        self.release = release
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._loading = None
+        self._stop = threading.Event()
+        self._watcher = None
+        path = current_snapshot_path(root)
+        self._current = _Handle(path, load(path))
+
+    @property
+    def current(self):
+        return self._current.resource
+
+    @property
+    def path(self):
+        return self._current.path
+
+    @contextmanager
+    def acquire(self):
+        """
+        Захватывает текущий снимок на время блока with.
+        """
+        with self._lock:
+            handle = self._current
+            handle.refs += 1
+        try:
+            yield handle.resource
+        finally:
+            with self._lock:
+                handle.refs -= 1
+                released = handle.retired and handle.refs == 0
+            if released:
+                self._release(handle)
+
+    def swap(self, path, resource):
+        """
+        Делает загруженный снимок текущим. Новые запросы сразу получают его.
+        """
+        with self._lock:
+            old = self._current
+            self._current = _Handle(path, resource)
+            old.retired = True
+            released = old.refs == 0
+        print(f"Switched index {self.root} to snapshot {path}")
+        if released:
+            self._release(old)
+
+    def _release(self, handle):
+        if handle.path != self._current.path and self.release is not None:
+            self.release(handle.path, handle.resource)
+        handle.resource = None
+
+    def refresh(self):
+        """
+        Проверяет указатель CURRENT и, если он сменился, загружает и подключает новый снимок.
+
+        :return: True, если снимок был подменен.
+        """
+        path = current_snapshot_path(self.root)
+        with self._lock:
+            if path == self._current.path or path == self._loading:
+                return False
+            self._loading = path
+        try:
+            resource = self.load(path)
+        finally:
+            with self._lock:
+                self._loading = None
+        self.swap(path, resource)
+        return True
+
+    def watch(self):
+        """
+        Запускает фоновый поток, который следит за указателем CURRENT.
+        """
+        if self._watcher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    # Недогруженный снимок не должен останавливать наблюдение
+                    print(f"Failed to load a new snapshot of {self.root}: {e}")
+
+        self._watcher = threading.Thread(
+            target=run, name=f"snapshot-watcher:{self.root}", daemon=True
+        )
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
@@ -1,14 +1,367 @@
+import hashlib
 import os
+import math
+import shutil
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings
 
-from llm import LLMModel
+from lexical import BM25Index
+from raptor.raptor.embedding_cache import EmbeddingCache
+from registry import config_key, get_embedding_cache, get_embeddings, get_registry
+from snapshots import SnapshotManager, current_snapshot_path, publish_snapshot
 from utils import load_documents_from_directory
 from tqdm import tqdm
 import json
 
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_CONFIG_FILE = "index_config.json"
+CENTROID_FILE = "centroid.npy"
+VECTOR_SUM_FILE = "vector_sum.npy"
+MANIFEST_FILE = "manifest.json"
+# Каталог BM25 индекса по тем же сегментам внутри каталога снимка FAISS индекса
+LEXICAL_INDEX_DIR = "bm25"
+# FAISS ожидает не меньше 39 обучающих векторов на каждый центроид
+MIN_POINTS_PER_CENTROID = 39
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 150
+
+_text_splitters = {}
+
+
+def resolve_index_params(index_type, num_vectors, dimension, params=None):
+    """
+    Подбирает параметры FAISS индекса под число векторов и их размерность.
+
+    nlist ограничивается так, чтобы каждому кластеру хватало обучающих векторов,
+    m для PQ берется делителем размерности, а nbits — таким, чтобы векторов
+    хватало на обучение 2**nbits центроидов каждой кодовой книги.
+
+    :param index_type: Тип индекса: flat, ivf_flat, ivf_pq или hnsw.
+    :param num_vectors: Число векторов в индексе.
+    :param dimension: Размерность векторов.
+    :param params: Запрошенные параметры (nlist, nprobe, m, nbits, M, ef_construction, ef_search).
+    :return: Словарь с итоговыми параметрами.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index_type must be one of {INDEX_TYPES}")
+    params = params or {}
+    resolved = {}
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = params.get("nlist") or int(4 * math.sqrt(num_vectors))
+        nlist = max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+        resolved["nlist"] = nlist
+        resolved["nprobe"] = max(1, min(params.get("nprobe") or 8, nlist))
+
+    if index_type == "ivf_pq":
+        m = min(params.get("m") or 16, dimension)
+        while dimension % m:
+            m -= 1
+        resolved["m"] = m
+        nbits = params.get("nbits") or 8
+        max_nbits = int(math.log2(max(num_vectors // MIN_POINTS_PER_CENTROID, 2)))
+        resolved["nbits"] = max(1, min(nbits, max_nbits))
+
+    if index_type == "hnsw":
+        resolved["M"] = params.get("M") or 32
+        resolved["ef_construction"] = params.get("ef_construction") or 40
+        resolved["ef_search"] = params.get("ef_search") or 64
+
+    return resolved
+
+
+def build_faiss_index(vectors, index_type, params):
+    """
+    Создает и при необходимости обучает пустой FAISS индекс по векторам.
+
+    :param vectors: Матрица float32 размером (число векторов x размерность).
+    :param index_type: Тип индекса из INDEX_TYPES.
+    :param params: Параметры из resolve_index_params.
+    :return: Индекс, готовый к добавлению векторов.
+    """
+    dimension = vectors.shape[1]
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+        return index
+
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"])
+    else:
+        index = faiss.IndexIVFPQ(
+            quantizer, dimension, params["nlist"], params["m"], params["nbits"]
+        )
+    index.train(vectors)
+    index.nprobe = params["nprobe"]
+    return index
+
+
+def split_document(document, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Разбивает документ на сегменты по токенам tiktoken.
+
+    :param document: Словарь с ключами content и metadata, как в load_documents_from_directory.
+    :return: Список текстов сегментов.
+    """
+    key = (chunk_size, chunk_overlap)
+    if key not in _text_splitters:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        _text_splitters[key] = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+    doc_obj = Document(page_content=document["content"], metadata=document["metadata"])
+    return [
+        split.page_content for split in _text_splitters[key].split_documents([doc_obj])
+    ]
+
+
+def document_hash(document):
+    return hashlib.sha256(document["content"].encode("utf-8")).hexdigest()
+
+
+def load_manifest(path):
+    """
+    Читает manifest.json индекса или возвращает None, если его нет.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def build_manifest(hashes, metadatas, version=1):
+    """
+    Строит манифест индекса: для каждого исходного файла хэш содержимого и id его сегментов.
+
+    :param hashes: Словарь имя файла -> хэш содержимого (см. document_hash).
+    :param metadatas: Метаданные сегментов с source и chunk_id.
+    :param version: Номер версии индекса.
+    :return: Словарь с ключами version, next_chunk_id и files.
+    """
+    files = {
+        source: {"hash": file_hash, "chunk_ids": []}
+        for source, file_hash in hashes.items()
+    }
+    for metadata in metadatas:
+        files[metadata["source"]]["chunk_ids"].append(str(metadata["chunk_id"]))
+    return {
+        "version": version,
+        "next_chunk_id": max((m["chunk_id"] for m in metadatas), default=0) + 1,
+        "files": files,
+    }
+
+
+def next_version(path):
+    """
+    Номер версии для следующего снимка индекса в каталоге path.
+    """
+    if not os.path.exists(path):
+        return 1
+    manifest = load_manifest(current_snapshot_path(path))
+    return manifest["version"] + 1 if manifest else 1
+
+
+def reconstruct_vectors(index, positions):
+    """
+    Восстанавливает векторы индекса по их позициям. IVF индексам для этого
+    строится прямое отображение позиций.
+
+    :return: Матрица float32 размером (число позиций x размерность).
+    """
+    positions = np.asarray(list(positions), dtype=np.int64)
+    if not len(positions):
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_batch(positions)
+
+
+def segment_texts(vector_store):
+    """
+    Тексты всех сегментов FAISS индекса в порядке их позиций в индексе.
+    """
+    docstore_ids = vector_store.index_to_docstore_id
+    return [
+        vector_store.docstore.search(docstore_ids[i]).page_content
+        for i in sorted(docstore_ids)
+    ]
+
+
+def write_index_directory(path, vector_store, index_config, vector_sum, manifest):
+    """
+    Сохраняет индекс с конфигурацией, центроидом, манифестом и BM25 индексом тех же
+    сегментов во временный каталог и публикует его как новый снимок индекса path
+    с версией из манифеста.
+
+    :return: Каталог опубликованного снимка.
+    """
+    staging_path = f"{path.rstrip(os.sep)}.tmp"
+    if os.path.exists(staging_path):
+        shutil.rmtree(staging_path)
+    vector_store.save_local(staging_path)
+    with open(
+        os.path.join(staging_path, INDEX_CONFIG_FILE), "w", encoding="utf-8"
+    ) as file:
+        json.dump(index_config, file, indent=2)
+    with open(os.path.join(staging_path, MANIFEST_FILE), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    np.save(os.path.join(staging_path, VECTOR_SUM_FILE), vector_sum)
+    np.save(
+        os.path.join(staging_path, CENTROID_FILE),
+        vector_sum / max(np.linalg.norm(vector_sum), 1e-12),
+    )
+    BM25Index(segment_texts(vector_store)).save(
+        os.path.join(staging_path, LEXICAL_INDEX_DIR)
+    )
+    return publish_snapshot(path, staging_path, manifest["version"])
+
+
+def save_faiss_index(
+    path,
+    texts,
+    metadatas,
+    vectors,
+    embeddings,
+    index_type="flat",
+    index_params=None,
+    manifest=None,
+):
+    """
+    Строит FAISS индекс по готовым эмбеддингам и атомарно публикует его в path.
+
+    Рядом с индексом сохраняются index_config.json, нормированный центроид,
+    манифест и BM25 индекс. Сегменты хранятся в docstore под id, равными их chunk_id.
+
+    :param path: Каталог индекса.
+    :param texts: Тексты сегментов.
+    :param metadatas: Метаданные сегментов (source и chunk_id).
+    :param vectors: Матрица float32 эмбеддингов сегментов.
+    :param embeddings: Модель эмбеддингов, с которой индекс будет использоваться.
+    :param index_type: Тип индекса из INDEX_TYPES.
+    :param index_params: Запрошенные параметры индекса, см. resolve_index_params.
+    :param manifest: Манифест из build_manifest. По умолчанию строится без хэшей файлов.
+    :return: Итоговые параметры индекса.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    params = resolve_index_params(
+        index_type, len(vectors), vectors.shape[1], index_params
+    )
+    index = build_faiss_index(vectors, index_type, params)
+
+    vector_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    vector_store.add_embeddings(
+        zip(texts, vectors),
+        metadatas=metadatas,
+        ids=[str(metadata["chunk_id"]) for metadata in metadatas],
+    )
+
+    if manifest is None:
+        sources = {metadata["source"]: None for metadata in metadatas}
+        manifest = build_manifest(sources, metadatas, next_version(path))
+    write_index_directory(
+        path,
+        vector_store,
+        {
+            "index_type": index_type,
+            "params": params,
+            "dimension": int(vectors.shape[1]),
+            "num_vectors": len(vectors),
+        },
+        vectors.sum(axis=0),
+        manifest,
+    )
+    return params
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        """
+        Обертка над Embeddings, которая читает и пишет векторы сегментов в общий
+        EmbeddingCache. Запросы (embed_query, embed_queries) эмбеддятся без кэша.
+
+        :param embeddings: Исходная модель эмбеддингов.
+        :param cache: Кэш эмбеддингов.
+        :param model_name: Имя модели, под которым векторы хранятся в кэше.
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        vectors = self.cache.embed(
+            self.model_name, texts, self.embeddings.embed_documents
+        )
+        return [vector.tolist() for vector in vectors]
+
+    def embed_queries(self, texts):
+        # Запросы в кэш не пишутся: разовые тексты вытесняли бы векторы сегментов
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+def embed_queries(embeddings, queries):
+    """
+    Эмбеддит тексты запросов в обход кэша эмбеддингов, если он есть.
+    """
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.embed_queries(queries)
+    return embeddings.embed_documents(queries)
+
+
+class IndexSnapshot:
+    def __init__(self, path, vector_store, index_config, manifest, lexical_index=None):
+        """
+        Одна загруженная версия индекса: FAISS с docstore, конфигурация индекса,
+        манифест и BM25 индекс тех же сегментов.
+
+        :param path: Каталог снимка.
+        :param lexical_index: BM25Index снимка или None, если хранилище без BM25.
+        """
+        self.path = path
+        self.vector_store = vector_store
+        self.index_config = index_config
+        self.manifest = manifest
+        self.lexical_index = lexical_index
+        self._centroid = None
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def centroid(self):
+        """
+        Нормированный средний вектор сегментов индекса, используется для маршрутизации запросов.
+        """
+        if self._centroid is None:
+            centroid_path = os.path.join(self.path, CENTROID_FILE)
+            if os.path.exists(centroid_path):
+                centroid = np.load(centroid_path)
+            else:
+                index = self.vector_store.index
+                centroid = index.reconstruct_n(0, index.ntotal).mean(axis=0)
+                centroid = centroid / max(np.linalg.norm(centroid), 1e-12)
+            self._centroid = centroid.astype(np.float32)
+        return self._centroid
+
 
 class FAISSVectorStore:
     def __init__(
@@ -16,59 +369,503 @@ class FAISSVectorStore:
         model_name_or_path="sentence-transformers/all-MiniLM-L6-v2",
         index_path="db/faiss_index",
         documents_path="RegDocs",
+        embedding_cache_path="db/embedding_cache.sqlite",
+        index_type="flat",
+        index_params=None,
+        documents=None,
+        embeddings=None,
+        watch=False,
+        poll_interval=5.0,
+        lexical=False,
     ):
+        """
+        FAISS хранилище сегментов регламентов.
+
+        :param documents: Документы для построения индекса вместо чтения documents_path.
+        :param embeddings: Готовая модель эмбеддингов, общая для нескольких хранилищ.
+        :param watch: Следить ли за указателем CURRENT и подключать новые снимки индекса на лету.
+        :param poll_interval: Период проверки указателя CURRENT в секундах.
+        :param lexical: Загружать ли вместе с каждым снимком его BM25 индекс для search_hybrid_batch.
+
+        Индекс хранится версионированными снимками index_path/snapshots/vNNNNNN, текущий
+        выбирается указателем index_path/CURRENT. Каждый поиск работает с одним снимком
+        от начала до конца, см. SnapshotManager.
+
+        Модель эмбеддингов, кэш эмбеддингов и загруженный индекс берутся из общего
+        реестра процесса, поэтому хранилища с одинаковыми настройками их разделяют.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {INDEX_TYPES}")
         self.model_name_or_path = model_name_or_path
         self.index_path = index_path
+        self.lexical = lexical
+        self.index_type = index_type
+        self.index_params = index_params or {}
         self.documents_path = documents_path
-        self.llm_model = LLMModel(temperature=0.05)
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache = (
+            get_embedding_cache(embedding_cache_path) if embedding_cache_path else None
+        )
+        self.embeddings = (
+            embeddings if embeddings is not None else self._create_embeddings()
+        )
 
-        if os.path.exists(self.index_path):
-            self.vector_store = FAISS.load_local(
-                self.index_path,
-                HuggingFaceEmbeddings(model_name=model_name_or_path),
-                allow_dangerous_deserialization=True,
-            )
-            print(f"Loaded existing FAISS index from {self.index_path}")
-        else:
-            documents = load_documents_from_directory(self.documents_path)
-            if documents:
-                self.create_faiss_index(documents)
-                self.vector_store = FAISS.load_local(
-                    self.index_path,
-                    HuggingFaceEmbeddings(model_name=model_name_or_path),
-                    allow_dangerous_deserialization=True,
-                )
-            else:
+        if not os.path.exists(self.index_path):
+            if documents is None:
+                documents = load_documents_from_directory(self.documents_path)
+            if not documents:
                 raise FileNotFoundError(
                     "No FAISS index found and no documents available to create one."
                 )
+            self.create_faiss_index(documents)
 
-    def create_faiss_index(self, documents):
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=400, chunk_overlap=150
+        self.snapshots = SnapshotManager(
+            self.index_path,
+            self._load_snapshot,
+            release=self._release_snapshot,
+            poll_interval=poll_interval,
+        )
+        print(
+            f"Loaded FAISS index ({self.index_config['index_type']}, version {self.version}) from {self.snapshots.path}"
         )
+        if watch:
+            self.snapshots.watch()
 
-        doc_splits = []
+    def _create_embeddings(self) -> Embeddings:
+        return get_embeddings(self.model_name_or_path, self.embedding_cache_path)
+
+    def _index_key(self, path):
+        return config_key(
+            path=os.path.abspath(path),
+            model=self.model_name_or_path,
+            embedding_cache=self.embedding_cache_path,
+        )
+
+    def _lexical_key(self, path):
+        return config_key(path=os.path.abspath(os.path.join(path, LEXICAL_INDEX_DIR)))
+
+    def _load_snapshot(self, path):
+        vector_store = get_registry().get(
+            "faiss_index",
+            self._index_key(path),
+            lambda: FAISS.load_local(
+                path,
+                self.embeddings,
+                allow_dangerous_deserialization=True,
+            ),
+        )
+        manifest = load_manifest(path) or self._derive_manifest(vector_store)
+        return self._snapshot(
+            path, vector_store, self._load_index_config(path), manifest
+        )
+
+    def _snapshot(self, path, vector_store, index_config, manifest):
+        # BM25 загружается вместе со снимком (в фоновом потоке при подмене), а не в запросе.
+        # Снимки старого формата без каталога bm25 получают его при первой загрузке
+        lexical_index = None
+        if self.lexical:
+            lexical_path = os.path.join(path, LEXICAL_INDEX_DIR)
+            lexical_index = get_registry().get(
+                "lexical_index",
+                self._lexical_key(path),
+                lambda: BM25Index.load_or_build(
+                    lexical_path, segment_texts(vector_store)
+                ),
+            )
+        return IndexSnapshot(path, vector_store, index_config, manifest, lexical_index)
+
+    def _release_snapshot(self, path, snapshot):
+        get_registry().discard("faiss_index", self._index_key(path))
+        get_registry().discard("lexical_index", self._lexical_key(path))
+        print(f"Released FAISS index snapshot {path}")
+
+    def close(self):
+        """
+        Останавливает наблюдение за указателем CURRENT.
+        """
+        self.snapshots.close()
+
+    @property
+    def snapshot(self):
+        return self.snapshots.current
+
+    @property
+    def vector_store(self):
+        return self.snapshot.vector_store
+
+    @property
+    def index_config(self):
+        return self.snapshot.index_config
+
+    @property
+    def manifest(self):
+        return self.snapshot.manifest
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def create_faiss_index(self, documents):
+        texts = []
+        metadatas = []
+        hashes = {}
         for doc in documents:
-            doc_obj = Document(page_content=doc["content"], metadata=doc["metadata"])
-            splits = text_splitter.split_documents([doc_obj])
-            doc_splits.extend(splits)
-
-        documents_for_faiss = []
-        for i, split in enumerate(doc_splits):
-            documents_for_faiss.append(
-                Document(
-                    page_content=split.page_content,
-                    metadata={"source": split.metadata["source"], "chunk_id": i + 1},
+            hashes[doc["metadata"]["source"]] = document_hash(doc)
+            for text in split_document(doc):
+                texts.append(text)
+                metadatas.append(
+                    {"source": doc["metadata"]["source"], "chunk_id": len(texts)}
                 )
+
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        params = save_faiss_index(
+            self.index_path,
+            texts,
+            metadatas,
+            vectors,
+            self.embeddings,
+            self.index_type,
+            self.index_params,
+            build_manifest(hashes, metadatas, next_version(self.index_path)),
+        )
+        print(f"FAISS index ({self.index_type}, {params}) saved to {self.index_path}")
+        if self.embedding_cache is not None:
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
+
+    def _load_index_config(self, path):
+        """
+        Читает index_config.json рядом с index.faiss. Индексы без него считаются плоскими.
+        """
+        config_path = os.path.join(path, INDEX_CONFIG_FILE)
+        if not os.path.exists(config_path):
+            return {"index_type": "flat", "params": {}}
+        with open(config_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _derive_manifest(self, vector_store):
+        """
+        Восстанавливает манифест индекса старого формата по docstore. Хэшей файлов
+        в нем нет, поэтому первое обновление переиндексирует все файлы.
+        """
+        files = {}
+        next_chunk_id = 1
+        for i in sorted(vector_store.index_to_docstore_id):
+            doc_id = vector_store.index_to_docstore_id[i]
+            metadata = vector_store.docstore.search(doc_id).metadata
+            files.setdefault(metadata["source"], {"hash": None, "chunk_ids": []})
+            files[metadata["source"]]["chunk_ids"].append(doc_id)
+            next_chunk_id = max(next_chunk_id, metadata.get("chunk_id", 0) + 1)
+        return {"version": 0, "next_chunk_id": next_chunk_id, "files": files}
+
+    def update(self, documents=None):
+        """
+        Обновляет индекс по изменившимся исходным файлам.
+
+        Файлы сравниваются с манифестом по хэшу содержимого. Векторы удаленных и
+        измененных файлов удаляются из индекса, эмбеддятся только сегменты новых и
+        измененных файлов. Плоский индекс обновляется на месте. IVF после удаления
+        не сдвигает номера векторов, а HNSW удаление не поддерживает, поэтому они
+        собираются заново из уже посчитанных векторов (IVF с прежним обученным
+        квантайзером). Обновленный индекс публикуется атомарно со следующим номером версии.
+
+        Новая версия сразу становится текущей для этого хранилища, другие процессы
+        подхватывают ее по указателю CURRENT.
+
+        :param documents: Текущие документы. По умолчанию читаются из documents_path.
+        :return: Сводка: version, added, changed, removed, chunks_added, chunks_removed.
+        """
+        with self.snapshots.acquire() as snapshot:
+            return self._update(snapshot, documents)
+
+    def _update(self, snapshot, documents):
+        if documents is None:
+            documents = load_documents_from_directory(self.documents_path)
+        documents = {doc["metadata"]["source"]: doc for doc in documents}
+        hashes = {source: document_hash(doc) for source, doc in documents.items()}
+        files = snapshot.manifest["files"]
+        removed = sorted(set(files) - set(documents))
+        changed = sorted(
+            source
+            for source in documents
+            if source in files and files[source]["hash"] != hashes[source]
+        )
+        added = sorted(set(documents) - set(files))
+        summary = {
+            "version": snapshot.version,
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+            "chunks_added": 0,
+            "chunks_removed": 0,
+        }
+        if not (removed or changed or added):
+            print(
+                f"FAISS index {self.index_path} is up to date (version {snapshot.version})"
             )
+            return summary
+
+        stale_ids = [
+            chunk_id
+            for source in removed + changed
+            for chunk_id in files[source]["chunk_ids"]
+        ]
+        next_chunk_id = snapshot.manifest["next_chunk_id"]
+        texts = []
+        metadatas = []
+        for source in changed + added:
+            for text in split_document(documents[source]):
+                texts.append(text)
+                metadatas.append({"source": source, "chunk_id": next_chunk_id})
+                next_chunk_id += 1
 
-        embedding_model = HuggingFaceEmbeddings(model_name=self.model_name_or_path)
-        vector_store = FAISS.from_documents(documents_for_faiss, embedding_model)
+        # Индекс меняется в отдельной копии: текущий объект продолжает обслуживать поиск
+        vector_store = FAISS.load_local(
+            snapshot.path, self.embeddings, allow_dangerous_deserialization=True
+        )
+        dimension = vector_store.index.d
+        vectors = np.asarray(
+            self.embeddings.embed_documents(texts), dtype=np.float32
+        ).reshape(len(texts), dimension)
+        # Векторы удаляемых сегментов восстанавливаются из самого индекса, чтобы
+        # обновить центроид без повторного эмбеддинга (для IVF-PQ — их приближения)
+        stale_set = set(stale_ids)
+        stale_positions = [
+            i
+            for i, doc_id in vector_store.index_to_docstore_id.items()
+            if doc_id in stale_set
+        ]
+        stale_vectors = reconstruct_vectors(
+            vector_store.index, stale_positions
+        ).reshape(len(stale_positions), dimension)
+        vector_sum = (
+            self._vector_sum(snapshot) - stale_vectors.sum(axis=0) + vectors.sum(axis=0)
+        )
+        ids = [str(metadata["chunk_id"]) for metadata in metadatas]
+
+        if not isinstance(vector_store.index, faiss.IndexFlat):
+            vector_store = self._rebuild_index(
+                vector_store,
+                snapshot.index_config["params"],
+                set(stale_ids),
+                texts,
+                metadatas,
+                vectors,
+                ids,
+            )
+        else:
+            if stale_ids:
+                vector_store.delete(stale_ids)
+            if texts:
+                vector_store.add_embeddings(
+                    zip(texts, vectors), metadatas=metadatas, ids=ids
+                )
 
-        vector_store.save_local(self.index_path)
-        print(f"FAISS index saved to {self.index_path}")
+        manifest_files = {
+            source: entry for source, entry in files.items() if source not in removed
+        }
+        for source in changed + added:
+            manifest_files[source] = {"hash": hashes[source], "chunk_ids": []}
+        for metadata in metadatas:
+            manifest_files[metadata["source"]]["chunk_ids"].append(
+                str(metadata["chunk_id"])
+            )
+        manifest = {
+            "version": snapshot.version + 1,
+            "next_chunk_id": next_chunk_id,
+            "files": manifest_files,
+        }
+        index_config = dict(
+            snapshot.index_config,
+            dimension=int(dimension),
+            num_vectors=int(vector_store.index.ntotal),
+        )
+        snapshot_path = write_index_directory(
+            self.index_path, vector_store, index_config, vector_sum, manifest
+        )
+        get_registry().put("faiss_index", self._index_key(snapshot_path), vector_store)
+        self.snapshots.swap(
+            snapshot_path,
+            self._snapshot(snapshot_path, vector_store, index_config, manifest),
+        )
+
+        summary.update(
+            version=manifest["version"],
+            chunks_added=len(texts),
+            chunks_removed=len(stale_ids),
+        )
+        print(
+            f"FAISS index {self.index_path} updated to version {manifest['version']}: "
+            f"+{len(texts)} / -{len(stale_ids)} chunks"
+        )
+        return summary
+
+    def _vector_sum(self, snapshot):
+        """
+        Сумма всех векторов индекса до обновления. Для индексов без vector_sum.npy
+        векторы восстанавливаются из индекса.
+        """
+        vector_sum_path = os.path.join(snapshot.path, VECTOR_SUM_FILE)
+        if os.path.exists(vector_sum_path):
+            return np.load(vector_sum_path)
+        index = snapshot.vector_store.index
+        return reconstruct_vectors(index, range(index.ntotal)).sum(axis=0)
+
+    def _rebuild_index(
+        self, vector_store, params, stale_ids, texts, metadatas, vectors, ids
+    ):
+        index = vector_store.index
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()
+        positions = [
+            i
+            for i in sorted(vector_store.index_to_docstore_id)
+            if vector_store.index_to_docstore_id[i] not in stale_ids
+        ]
+        kept_ids = [vector_store.index_to_docstore_id[i] for i in positions]
+        kept_docs = [vector_store.docstore.search(doc_id) for doc_id in kept_ids]
+        kept_vectors = index.reconstruct_n(0, index.ntotal)[positions]
+
+        all_vectors = np.concatenate([kept_vectors, vectors])
+        if isinstance(index, faiss.IndexIVF):
+            new_index = faiss.clone_index(index)
+            new_index.reset()
+        else:
+            new_index = build_faiss_index(all_vectors, "hnsw", params)
+        rebuilt = FAISS(
+            embedding_function=self.embeddings,
+            index=new_index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+        )
+        rebuilt.add_embeddings(
+            zip([doc.page_content for doc in kept_docs] + texts, all_vectors),
+            metadatas=[doc.metadata for doc in kept_docs] + metadatas,
+            ids=kept_ids + ids,
+        )
+        return rebuilt
+
+    @property
+    def centroid(self):
+        return self.snapshot.centroid
+
+    def segment_texts(self):
+        """
+        Тексты всех сегментов индекса в порядке их позиций в FAISS.
+        """
+        with self.snapshots.acquire() as snapshot:
+            return segment_texts(snapshot.vector_store)
+
+    def _search_parameters(self, index, nprobe=None, ef_search=None):
+        """
+        Параметры поиска для одного запроса, не меняющие общих настроек индекса.
+
+        nprobe применяется только к IVF индексам, ef_search — только к HNSW.
+        """
+        if nprobe is not None and isinstance(index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(nprobe=nprobe)
+        if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=ef_search)
+        return None
+
+    def search_similar(self, query, k=2, nprobe=None, ef_search=None):
+        """
+        Ищет в индексе сегменты, похожие на запрос.
+
+        :param query: Текст запроса.
+        :param k: Количество сегментов.
+        :param nprobe: Число просматриваемых IVF кластеров (больше — выше полнота, медленнее).
+        :param ef_search: Размер списка кандидатов HNSW (больше — выше полнота, медленнее).
+        :return: Список пар (сегмент, score).
+        """
+        return self.search_similar_batch([query], k, nprobe, ef_search)[0]
+
+    def search_similar_batch(self, queries, k=2, nprobe=None, ef_search=None):
+        """
+        Searches the index for several queries at once.
+
+        All queries are embedded in one call and searched with a single FAISS
+        search over the query matrix.
+
+        :param queries: List of query texts.
+        :param k: Number of segments to return for each query.
+        :param nprobe: Number of IVF lists to probe. Defaults to the value stored with the index.
+        :param ef_search: HNSW search depth. Defaults to the value stored with the index.
+        :return: A list with (segment, score) pairs for every query, in input order.
+        """
+        if not queries:
+            return []
+
+        vectors = np.asarray(
+            embed_queries(self.embeddings, list(queries)),
+            dtype=np.float32,
+        )
+        return self.search_vectors(vectors, k, nprobe, ef_search)
+
+    def search_vectors(self, vectors, k=2, nprobe=None, ef_search=None):
+        """
+        Ищет сегменты по уже посчитанным эмбеддингам запросов.
+
+        :param vectors: Матрица float32 эмбеддингов запросов.
+        :param k: Количество сегментов на запрос.
+        :param nprobe: Число просматриваемых IVF кластеров.
+        :param ef_search: Размер списка кандидатов HNSW.
+        :return: Список пар (сегмент, score) для каждого запроса.
+        """
+        # Весь поиск идет по одному снимку, даже если во время него подключен новый
+        with self.snapshots.acquire() as snapshot:
+            return self._search_snapshot(snapshot, vectors, k, nprobe, ef_search)
+
+    def search_hybrid_batch(self, queries, k=2, nprobe=None, ef_search=None):
+        """
+        Ищет сегменты для пачки запросов одновременно в FAISS и в BM25 индексе.
+
+        :return: Пара списков для каждого запроса: (сегмент, расстояние) из FAISS
+            и (сегмент, BM25 score) по убыванию score.
+        """
+        if not queries:
+            return [], []
+
+        queries = list(queries)
+        vectors = np.asarray(embed_queries(self.embeddings, queries), dtype=np.float32)
+        return self.search_hybrid_vectors(vectors, queries, k, nprobe, ef_search)
+
+    def search_hybrid_vectors(self, vectors, queries, k=2, nprobe=None, ef_search=None):
+        """
+        Ищет эмбеддинги vectors в FAISS и тексты queries в BM25 индексе одного и того же снимка.
+
+        :param vectors: Матрица float32 эмбеддингов запросов для FAISS, может быть пустой.
+        :param queries: Тексты запросов для BM25.
+        :return: Пара: результаты FAISS по строкам vectors и результаты BM25 по queries.
+        """
+        if not self.lexical:
+            raise ValueError("search_hybrid_vectors requires a store with lexical=True")
+        with self.snapshots.acquire() as snapshot:
+            return (
+                self._search_snapshot(snapshot, vectors, k, nprobe, ef_search),
+                snapshot.lexical_index.search_batch(queries, k=k),
+            )
+
+    def _search_snapshot(self, snapshot, vectors, k, nprobe=None, ef_search=None):
+        vectors = np.array(vectors, dtype=np.float32)
+        if not len(vectors):
+            return []
+        vector_store = snapshot.vector_store
+        if vector_store._normalize_L2:
+            faiss.normalize_L2(vectors)
+        scores, indices = vector_store.index.search(
+            vectors,
+            k,
+            params=self._search_parameters(vector_store.index, nprobe, ef_search),
+        )
 
-    def search_similar(self, query, k=2):
-        results = self.vector_store.similarity_search_with_score(query=query, k=k)
-        return [(doc.page_content, score) for doc, score in results]
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            row = []
+            for score, i in zip(row_scores, row_indices):
+                if i == -1:
+                    continue
+                doc_id = vector_store.index_to_docstore_id[i]
+                doc = vector_store.docstore.search(doc_id)
+                row.append((doc.page_content, float(score)))
+            results.append(row)
+        return results
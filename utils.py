@@ -72,18 +72,27 @@ def convert_pdf_to_text(file_path):
     return "\n".join([page.extract_text() for page in reader.pages])
 
 
+def load_document(file_path):
+    """
+    Загружает один .docx, .pdf или .txt файл. Для остальных файлов возвращает None.
+    """
+    filename = os.path.basename(file_path)
+    if filename.endswith(".docx"):
+        text = convert_docx_to_text(file_path)
+    elif filename.endswith(".pdf"):
+        text = convert_pdf_to_text(file_path)
+    elif filename.endswith(".txt"):
+        with open(file_path, "r", encoding="utf-8") as file:
+            text = file.read()
+    else:
+        return None
+    return {"content": text, "metadata": {"source": filename}}
+
+
 def load_documents_from_directory(directory_path):
     documents = []
     for filename in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, filename)
-        if filename.endswith(".docx"):
-            text = convert_docx_to_text(file_path)
-        elif filename.endswith(".pdf"):
-            text = convert_pdf_to_text(file_path)
-        elif filename.endswith(".txt"):
-            with open(file_path, "r", encoding="utf-8") as file:
-                text = file.read()
-        else:
-            continue
-        documents.append({"content": text, "metadata": {"source": filename}})
+        document = load_document(os.path.join(directory_path, filename))
+        if document is not None:
+            documents.append(document)
     return documents
@@ -1,17 +1,39 @@
 import streamlit as st
 import pandas as pd
+import hashlib
 import io
 import os
 from utils import convert_docx_to_text
 import pandas as pd
 from utils import generate_pdf_report
 from rag import CertRAG
+from response_cache import ResponseCache
 
-cert_rag = CertRAG(rag_type="default")
+
+@st.cache_resource(show_spinner="Загрузка моделей и индексов...")
+def get_cert_rag():
+    # Один экземпляр на процесс сервера: индексы, эмбеддинги, реранкер и клиенты LLM
+    # не пересоздаются при каждом перезапуске скрипта Streamlit. Новые снимки индекса
+    # подключаются на лету без перезапуска сервера
+    cert_rag = CertRAG(rag_type="default", preload_reranker=True, watch_index=True)
+    cert_rag.warm_up()
+    return cert_rag
+
+
+@st.cache_resource
+def get_result_cache(config_key):
+    # Результаты по файлам, ключ - хэш содержимого файла
+    return ResponseCache(
+        "db/file_results.sqlite",
+        namespace=ResponseCache.make_key(config=config_key, translated=True),
+    )
+
+
+cert_rag = get_cert_rag()
 
 
 def process_single_requirement(text):
-    compliance_result = cert_rag.cert_documents(text)
+    compliance_result = cert_rag.cert_documents(text, translate_comment=True)
     return {
         "Объект": compliance_result["object"],
         "Тип": compliance_result["type"],
@@ -19,6 +41,65 @@ def process_single_requirement(text):
     }
 
 
+def cancel_batch():
+    st.session_state.batch_cancelled = True
+
+
+def count_verdicts(results):
+    correct_count = sum(1 for r in results if r["type"] in ["0", "1", "2"])
+    error_count = sum(1 for r in results if r.get("error"))
+    violation_count = len(results) - correct_count - error_count
+    return correct_count, violation_count, error_count
+
+
+def show_counters(container, results):
+    correct_count, violation_count, error_count = count_verdicts(results)
+    with container.container():
+        st.markdown(f"**✅ Корректных требований:** {correct_count}")
+        st.markdown(f"**❌ Нарушений:** {violation_count}")
+        if error_count:
+            st.markdown(f"**⚠️ Ошибок проверки:** {error_count}")
+
+
+def to_dataframe(results):
+    df = pd.DataFrame(results)
+    df.rename(columns={"object": "Объект"}, inplace=True)
+    df.rename(columns={"type": "Тип"}, inplace=True)
+    df.rename(columns={"comment": "Комментарий"}, inplace=True)
+    df.rename(columns={"filename": "Файл"}, inplace=True)
+    df.rename(columns={"error": "Ошибка"}, inplace=True)
+    return df
+
+
+def show_report(results):
+    st.header("📊 Отчет:")
+    show_counters(st.empty(), results)
+    correct_count, violation_count, _ = count_verdicts(results)
+
+    df = to_dataframe(results)
+    st.dataframe(df, width=1000)
+
+    pdf_buffer = generate_pdf_report(df, correct_count, violation_count)
+
+    st.download_button(
+        label="Скачать (PDF)",
+        data=pdf_buffer,
+        file_name="report.pdf",
+        mime="application/pdf",
+    )
+
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name="Report", index=False)
+    excel_buffer.seek(0)
+    st.download_button(
+        label="Скачать (Excel)",
+        data=excel_buffer,
+        file_name="report.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
 st.set_page_config(layout="wide")
 st.title("📋 Система проверки требований 📋")
 
@@ -41,15 +122,7 @@ with tab1:
 
             for key, value in result.items():
                 if key != "Рекомендация":
-                    if key == "Комментарий":
-
-                        translation_prompt = f"Translate the following text from English to Russian:\n\n{value}\n\nTranslation:"
-                        russian_translation = cert_rag.llm.generate_response(
-                            translation_prompt, {}
-                        )
-                        st.markdown(f"**{key}:** {russian_translation}")
-                    else:
-                        st.markdown(f"**{key}:** {value}")
+                    st.markdown(f"**{key}:** {value}")
         else:
             st.warning("Пожалуйста, введите текст требования.")
 
@@ -61,62 +134,77 @@ with tab2:
     )
     folder_path = st.text_input("Или укажите путь к папке с требованиями:")
 
+    if st.session_state.pop("batch_cancelled", False):
+        st.warning("Проверка отменена.")
+        partial_results = st.session_state.get("batch_results", [])
+        if partial_results:
+            show_report(partial_results)
+
     if st.button("Проверить все 🔎"):
-        files_text = []
+        files = []
         if uploaded_files:
             for file in uploaded_files:
-                files_text.append((file.name, convert_docx_to_text(file)))
+                files.append((file.name, file.getvalue()))
         elif folder_path:
             for filename in os.listdir(folder_path):
                 if filename.endswith(".docx") or filename.endswith(".txt"):
                     with open(os.path.join(folder_path, filename), "rb") as file:
-                        files_text.append((filename, convert_docx_to_text(file)))
-
-        if files_text:
-            # results = [cert_rag.cert_documents(text) for _, text in files_text]
-            results = [
-                {"filename": filename, **cert_rag.cert_documents(text)}
-                for filename, text in files_text
-            ]
-
-            for result in results:
-                if result.get("comment"):
-                    translation_prompt = f"Translate the following text from English to Russian:\n\n{result['comment']}\n\nTranslation:"
-                    result["comment"] = cert_rag.llm.generate_response(
-                        translation_prompt, {}
-                    )
-            st.header("📊 Отчет:")
-            correct_count = sum(1 for r in results if r["type"] in ["0", "1", "2"])
-            violation_count = len(results) - correct_count
-            st.markdown(f"**✅ Корректных требований:** {correct_count}")
-            st.markdown(f"**❌ Нарушений:** {violation_count}")
-
-            df = pd.DataFrame(results)
-            df.rename(columns={"object": "Объект"}, inplace=True)
-            df.rename(columns={"type": "Тип"}, inplace=True)
-            df.rename(columns={"comment": "Комментарий"}, inplace=True)
-            df.rename(columns={"filename": "Файл"}, inplace=True)
-            st.dataframe(df, width=1000)
-
-            pdf_buffer = generate_pdf_report(df, correct_count, violation_count)
-
-            st.download_button(
-                label="Скачать (PDF)",
-                data=pdf_buffer,
-                file_name="report.pdf",
-                mime="application/pdf",
-            )
-
-            excel_buffer = io.BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
-                df.to_excel(writer, sheet_name="Report", index=False)
-            excel_buffer.seek(0)
-            st.download_button(
-                label="Скачать (Excel)",
-                data=excel_buffer,
-                file_name="report.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        files.append((filename, file.read()))
+
+        if files:
+            st.button("Отменить ⏹", on_click=cancel_batch)
+            progress_bar = st.progress(0.0, text=f"Проверено 0 из {len(files)}")
+            counters = st.empty()
+            table = st.empty()
+
+            rows = [None] * len(files)
+            # Файлы с одинаковым содержимым проверяются один раз
+            pending = {}
+            # Пространство кэша зависит от версии индекса, которая может смениться во время проверки
+            result_cache = get_result_cache(cert_rag.config_key())
+            for i, (filename, content) in enumerate(files):
+                key = hashlib.sha256(content).hexdigest()
+                cached = result_cache.get(key)
+                if cached is not None:
+                    rows[i] = {"filename": filename, **cached}
+                else:
+                    pending.setdefault(key, []).append(i)
+            pending_keys = list(pending)
+
+            def show_progress():
+                finished = [row for row in rows if row is not None]
+                st.session_state.batch_results = finished
+                progress_bar.progress(
+                    len(finished) / len(files),
+                    text=f"Проверено {len(finished)} из {len(files)}",
+                )
+                show_counters(counters, finished)
+                table.dataframe(to_dataframe(finished), width=1000)
+
+            show_progress()
+            batch = cert_rag.iter_documents(
+                [
+                    convert_docx_to_text(io.BytesIO(files[pending[key][0]][1]))
+                    for key in pending_keys
+                ],
+                translate_comments=True,
             )
+            try:
+                for j, result, config_key in batch:
+                    # Результат сохраняется под версией индекса, по которой он получен
+                    if config_key is not None and not result.get("error"):
+                        get_result_cache(config_key).set(pending_keys[j], result)
+                    for i in pending[pending_keys[j]]:
+                        rows[i] = {"filename": files[i][0], **result}
+                    show_progress()
+            finally:
+                # Прерванный запуск (кнопка отмены) отменяет незавершенные проверки
+                batch.close()
+
+            progress_bar.empty()
+            counters.empty()
+            table.empty()
+            show_report(rows)
         else:
             st.warning(
                 "Нет файлов для анализа. Пожалуйста, загрузите файлы или укажите корректный путь к папке."